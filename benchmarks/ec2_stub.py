@@ -0,0 +1,220 @@
+"""
+Synthetic EC2 Stub
+
+This module stands in for boto3 sessions and EC2 clients in the benchmarks. It
+serves describe_volumes, describe_security_group_rules, describe_instances and
+describe_security_groups pages generated on the fly from a record index, so a
+fixture of a million volumes costs no memory until the analyzers keep findings.
+
+The mix of volume types, encryption, attachments, CIDRs and ports is fixed, so
+every run of a scenario produces the same findings and API call counts.
+"""
+
+import threading
+import time
+from collections import Counter
+
+# describe_volumes returns up to 500 records per call, describe_security_group_rules up to 1000
+DEFAULT_PAGE_SIZES = {
+    'describe_volumes': 500,
+    'describe_security_group_rules': 1000,
+    'describe_instances': 1000,
+    'describe_security_groups': 1000,
+}
+
+VOLUME_TYPES = ['gp2', 'gp3', 'gp3', 'io2', 'gp2', 'st1', 'gp3', 'gp2', 'sc1', 'gp3']
+PROTOCOLS = ['tcp', 'tcp', 'tcp', 'udp', '-1', 'icmp']
+PORTS = [(22, 22), (443, 443), (80, 80), (3389, 3389), (1024, 65535), (5432, 5432), (8080, 8080)]
+SOURCES = [
+    {'CidrIpv4': '10.0.0.0/16'},
+    {'CidrIpv4': '0.0.0.0/0'},
+    {'CidrIpv4': '203.0.113.0/24'},
+    {'CidrIpv4': '172.16.0.0/12'},
+    {'CidrIpv4': '52.0.0.0/8'},
+    {'CidrIpv4': '198.51.100.0/16'},
+    {'CidrIpv6': '::/0'},
+    {'CidrIpv6': '2001:db8::/32'},
+    {'PrefixListId': 'pl-0123456789abcdef0'},
+    {'ReferencedGroupInfo': {'GroupId': 'sg-0123456789abcdef0'}},
+]
+RULES_PER_GROUP = 20
+INSTANCE_STATES = ['running', 'running', 'stopped']
+
+
+class SyntheticAccount:
+    """
+    Deterministic EC2 inventory of one account, spread evenly over its regions.
+
+    Args:
+        regions (List[str]): Region names.
+        volumes (int): Total number of volumes across all regions.
+        rules (int): Total number of security group rules across all regions.
+    """
+
+    def __init__(self, regions, volumes=0, rules=0):
+        self.regions = list(regions)
+        self.volumes_per_region = volumes // len(self.regions)
+        self.rules_per_region = rules // len(self.regions)
+        self.api_calls = Counter()  # Operation name -> calls served
+        self.generation_seconds = 0.0  # Time spent building responses, excluded from analyzer timings
+        self.lock = threading.Lock()  # Regions are paged from parallel workers
+
+    def volume(self, region, index):
+        region_index = self.regions.index(region)
+        in_use = index % 5 != 0
+        attachments = []
+        if in_use:
+            attachments.append({'InstanceId': self.instance_id(region_index, index // 2), 'State': 'attached'})
+            if index % 50 == 1:
+                # Multi-attach io2 volume
+                attachments.append({'InstanceId': self.instance_id(region_index, index // 2 + 1), 'State': 'attached'})
+        tags = [{'Key': 'Name', 'Value': f'data-{index}'}]
+        if index % 20 == 0:
+            tags.append({'Key': 'Environment', 'Value': 'dev'})
+        return {
+            'VolumeId': f'vol-{region_index:02x}{index:015x}',
+            'VolumeType': VOLUME_TYPES[index % len(VOLUME_TYPES)],
+            'State': 'in-use' if in_use else 'available',
+            'Size': 8 + index % 500,
+            'Iops': 100 + index % 3000,
+            'Encrypted': index % 3 != 0,
+            'AvailabilityZone': f'{region}{"abc"[index % 3]}',
+            'Attachments': attachments,
+            'Tags': tags,
+        }
+
+    def rule(self, region, index):
+        region_index = self.regions.index(region)
+        from_port, to_port = PORTS[index % len(PORTS)]
+        protocol = PROTOCOLS[index % len(PROTOCOLS)]
+        if protocol == '-1':
+            from_port, to_port = -1, -1
+        elif protocol == 'icmp':
+            from_port, to_port = 8, 0
+        return {
+            'SecurityGroupRuleId': f'sgr-{region_index:02x}{index:015x}',
+            'GroupId': self.group_id(region_index, index // RULES_PER_GROUP),
+            'GroupOwnerId': '123456789012',
+            'IsEgress': index % 4 == 0,
+            'IpProtocol': protocol,
+            'FromPort': from_port,
+            'ToPort': to_port,
+            **SOURCES[(index // 7) % len(SOURCES)],
+        }
+
+    @staticmethod
+    def instance_id(region_index, index):
+        return f'i-{region_index:02x}{index:015x}'
+
+    @staticmethod
+    def group_id(region_index, index):
+        return f'sg-{region_index:02x}{index:015x}'
+
+    def records(self, operation, region, filters):
+        """
+        Yields the records an operation returns in a region, after applying the request's filters.
+        """
+        filters = {item['Name']: set(item['Values']) for item in filters or []}
+        if operation == 'describe_volumes':
+            for index in range(self.volumes_per_region):
+                volume = self.volume(region, index)
+                if 'volume-type' in filters and volume['VolumeType'] not in filters['volume-type']:
+                    continue
+                if 'encrypted' in filters and str(volume['Encrypted']).lower() not in filters['encrypted']:
+                    continue
+                yield volume
+        elif operation == 'describe_security_group_rules':
+            for index in range(self.rules_per_region):
+                yield self.rule(region, index)
+        elif operation == 'describe_instances':
+            for instance_id in sorted(filters.get('instance-id', ())):
+                yield {
+                    'InstanceId': instance_id,
+                    'State': {'Name': INSTANCE_STATES[int(instance_id[-4:], 16) % len(INSTANCE_STATES)]},
+                    'Tags': [{'Key': 'Name', 'Value': f'app-{instance_id[-6:]}'}],
+                }
+        elif operation == 'describe_security_groups':
+            for group_id in sorted(filters.get('group-id', ())):
+                yield {
+                    'GroupId': group_id,
+                    'GroupName': f'group-{group_id[-6:]}',
+                    'Description': 'Synthetic security group',
+                    'VpcId': f'vpc-{group_id[3:5]}',
+                }
+        else:
+            raise NotImplementedError(f"The EC2 stub does not serve {operation}")
+
+
+class StubPaginator:
+    """
+    Serves pages of synthetic records, counting one API call per page.
+    """
+
+    RESPONSE_KEYS = {
+        'describe_volumes': 'Volumes',
+        'describe_security_group_rules': 'SecurityGroupRules',
+        'describe_instances': 'Reservations',
+        'describe_security_groups': 'SecurityGroups',
+    }
+
+    def __init__(self, account, operation, region):
+        self.account = account
+        self.operation = operation
+        self.region = region
+
+    def paginate(self, PaginationConfig=None, Filters=None, **kwargs):
+        page_size = (PaginationConfig or {}).get('PageSize') or DEFAULT_PAGE_SIZES[self.operation]
+        records = self.account.records(self.operation, self.region, Filters)
+        while True:
+            started = time.perf_counter()
+            page = [record for _, record in zip(range(page_size), records)]
+            with self.account.lock:
+                self.account.generation_seconds += time.perf_counter() - started
+                self.account.api_calls[self.operation] += 1
+            # Instances come wrapped in reservations, one per page is enough for the analyzers
+            response = [{'Instances': page}] if self.operation == 'describe_instances' else page
+            yield {self.RESPONSE_KEYS[self.operation]: response}
+            if len(page) < page_size:
+                return
+
+
+class StubEvents:
+    """
+    Accepts event handler registrations without firing them, so rate limiting and
+    API metrics do not skew analyzer timings.
+    """
+
+    def register(self, event_name, handler, *args, **kwargs):
+        pass
+
+    def unregister(self, event_name, handler=None, *args, **kwargs):
+        pass
+
+
+class StubMeta:
+    def __init__(self, region):
+        self.region_name = region
+        self.events = StubEvents()
+
+
+class StubEC2Client:
+    def __init__(self, account, region):
+        self.account = account
+        self.meta = StubMeta(region)
+
+    def get_paginator(self, operation):
+        return StubPaginator(self.account, operation, self.meta.region_name)
+
+
+class StubSession:
+    """
+    Drop-in for the boto3 session returned by assume_role, only EC2 clients are available.
+    """
+
+    def __init__(self, account):
+        self.account = account
+
+    def client(self, service, region_name=None, config=None, **kwargs):
+        if service != 'ec2':
+            raise NotImplementedError(f"The EC2 stub does not serve {service}")
+        return StubEC2Client(self.account, region_name)
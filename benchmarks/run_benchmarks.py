@@ -0,0 +1,191 @@
+"""
+Analyzer Benchmarks
+
+This script runs the EBS and security group analyzers end to end against the
+synthetic EC2 stub: the shared region scan, report() with its enrichment calls
+and CSV rendering. It reports throughput, peak RSS and API call counts per
+scenario. Each scenario runs in its own process, so peak RSS is not inflated by
+the ones before it.
+
+The benchmarks live outside python/ so they are not packaged with the Lambda.
+They need botocore installed, no AWS account or network access is used.
+With --replay, the scenario is a capture recorded by the Lambda's "capture_path"
+option, so the numbers reflect a real account's inventory.
+
+Usage:
+    python benchmarks/run_benchmarks.py                      # default scenarios
+    python benchmarks/run_benchmarks.py volumes-1m sg-rules-500k
+    python benchmarks/run_benchmarks.py --all --json results.json
+    python benchmarks/run_benchmarks.py --engine async mixed-100k
+    python benchmarks/run_benchmarks.py --replay /tmp/captures/run.cap
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, '..', 'python'))
+os.environ.setdefault('METRICS_SINK', 'none')
+
+from ec2_stub import SyntheticAccount, StubSession  # noqa: E402
+
+ACCOUNT_ID = '123456789012'
+REGIONS = [
+    'us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'ca-central-1', 'eu-west-1', 'eu-west-2', 'eu-west-3',
+    'eu-central-1', 'eu-north-1', 'ap-south-1', 'ap-northeast-1', 'ap-northeast-2', 'ap-northeast-3',
+    'ap-southeast-1', 'ap-southeast-2', 'sa-east-1',
+]
+
+SCENARIOS = {
+    'volumes-10k': {'volumes': 10_000, 'rules': 0, 'regions': 4},
+    'volumes-100k': {'volumes': 100_000, 'rules': 0, 'regions': 17},
+    'volumes-1m': {'volumes': 1_000_000, 'rules': 0, 'regions': 17},
+    'sg-rules-50k': {'volumes': 0, 'rules': 50_000, 'regions': 4},
+    'sg-rules-500k': {'volumes': 0, 'rules': 500_000, 'regions': 17},
+    'mixed-100k': {'volumes': 100_000, 'rules': 100_000, 'regions': 17},
+}
+DEFAULT_SCENARIOS = ['volumes-10k', 'volumes-100k', 'sg-rules-50k', 'mixed-100k']
+
+# One of each kind of exclusion rule, so matching cost is part of the numbers
+EXCLUSIONS = {
+    'ebs_gp2_volume_ids': ['vol-00000000000000000a', 'vol-01*', 'tag:Environment=dev'],
+    'ebs_unencrypted_volume_ids': ['vol-00000000000000000b', 'vol-02*', 'tag:Environment=dev'],
+    'security_group_rule_ids': ['sgr-00000000000000000c', 'sgr-01*'],
+}
+
+
+def run_scenario(name, engine='threads', replay_path=None):
+    """
+    Runs one scenario in the current process and returns its measurements.
+    A replayed capture runs every check for the first account in it.
+    """
+    from library.aws.async_inventory import AsyncRegionInventory
+    from library.aws.inventory_capture import CaptureReader, ReplaySession
+    from library.aws.region_inventory import RegionInventory
+    from library.aws.registry import get_analyzer
+    from library.helpers.render_csv import render_csv
+
+    if replay_path:
+        reader = CaptureReader(replay_path)
+        account_id = reader.accounts()[0]
+        session = ReplaySession(reader, account_id)
+        regions = session.regions()
+        volumes = reader.record_count(account_id, 'describe_volumes')
+        rules = reader.record_count(account_id, 'describe_security_group_rules')
+        account = None
+    else:
+        scenario = SCENARIOS[name]
+        account_id = ACCOUNT_ID
+        regions = REGIONS[:scenario['regions']]
+        account = SyntheticAccount(regions, volumes=scenario['volumes'], rules=scenario['rules'])
+        session = StubSession(account)
+        volumes = account.volumes_per_region * len(regions)
+        rules = account.rules_per_region * len(regions)
+    inventory_class = AsyncRegionInventory if engine == 'async' else RegionInventory
+    inventory = inventory_class(session, account_id=account_id)
+
+    checks = []
+    if volumes:
+        checks += ['ebs_gp2', 'ebs_unencrypted']
+    if rules:
+        checks += ['security_groups']
+    analyzers = {check: get_analyzer(check)(account_id, session, EXCLUSIONS, inventory) for check in checks}
+
+    # Analyzer output is not part of the measurement
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        inventory.scan(regions, list(analyzers.values()))
+        scanned = time.perf_counter()
+        reports = {check: analyzer.report(regions) for check, analyzer in analyzers.items()}
+        reported = time.perf_counter()
+        rendered = [render_csv(report) for report in reports.values() if report]
+        finished = time.perf_counter()
+
+    records = volumes + rules
+    # Replayed pages are decompressed as they are read, which is counted as analysis time
+    stub_seconds = account.generation_seconds if account else 0
+    analysis_seconds = (reported - started) - stub_seconds
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        'scenario': name,
+        'engine': engine,
+        'regions': len(regions),
+        'records': records,
+        'findings': {check: len(report['csv_data']) if report else 0 for check, report in reports.items()},
+        'scan_seconds': round(scanned - started, 3),
+        'report_seconds': round(reported - scanned, 3),
+        'render_seconds': round(finished - reported, 3),
+        'stub_seconds': round(stub_seconds, 3),
+        'records_per_second': round(records / analysis_seconds) if analysis_seconds > 0 else None,
+        'api_calls': dict(account.api_calls) if account else {'replayed_pages': inventory.api_calls},
+        'csv_bytes': sum(len(data) for _, data in rendered),
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        'peak_rss_mb': round(peak_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+    }
+
+
+def run_in_subprocess(name, engine, replay_path=None):
+    command = [sys.executable, os.path.abspath(__file__), '--child', name, '--engine', engine]
+    if replay_path:
+        command += ['--replay', replay_path]
+    completed = subprocess.run(command, capture_output=True, text=True, check=False)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Scenario {name} failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def print_table(results):
+    header = f"{'scenario':<15} {'engine':<7} {'records':>9} {'findings':>9} {'scan s':>8} {'report s':>9} {'csv s':>7} {'stub s':>7} {'records/s':>10} {'api calls':>10} {'csv MB':>7} {'peak RSS MB':>12}"
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        # None when stub time swallowed the whole measurement, e.g. on a noisy machine
+        records_per_second = result['records_per_second'] if result['records_per_second'] is not None else '-'
+        print(
+            f"{result['scenario']:<15} {result['engine']:<7} {result['records']:>9} {sum(result['findings'].values()):>9} "
+            f"{result['scan_seconds']:>8} {result['report_seconds']:>9} {result['render_seconds']:>7} "
+            f"{result['stub_seconds']:>7} {records_per_second:>10} {sum(result['api_calls'].values()):>10} "
+            f"{result['csv_bytes'] / (1024 * 1024):>7.1f} {result['peak_rss_mb']:>12}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the compliance analyzers against synthetic EC2 inventory.")
+    parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run: {', '.join(SCENARIOS)}.")
+    parser.add_argument('--all', action='store_true', help="Run every scenario, including the 1M volume one.")
+    parser.add_argument('--engine', choices=['threads', 'async'], default='threads', help="Region scan engine.")
+    parser.add_argument('--json', metavar='PATH', help="Also write the results to a JSON file.")
+    parser.add_argument('--replay', metavar='PATH', help="Benchmark a captured inventory instead of the scenarios.")
+    parser.add_argument('--child', metavar='SCENARIO', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_scenario(args.child, args.engine, args.replay)))
+        return
+
+    if args.replay:
+        names = ['replay']
+    else:
+        names = list(SCENARIOS) if args.all else (args.scenarios or DEFAULT_SCENARIOS)
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            parser.error(f"unknown scenarios {unknown}, choose from {', '.join(SCENARIOS)}")
+    results = []
+    for name in names:
+        print(f"Running {name}...", file=sys.stderr)
+        results.append(run_in_subprocess(name, args.engine, args.replay))
+
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as results_file:
+            json.dump(results, results_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -27,7 +27,7 @@ resource "aws_iam_role_policy" "lambda_inline" {
 
   policy = jsonencode({
     "Version" : "2012-10-17",
-    "Statement" : [
+    "Statement" : concat([
       {
         "Sid" : "SESSendEmail",
         "Effect" : "Allow",
@@ -45,7 +45,61 @@ resource "aws_iam_role_policy" "lambda_inline" {
         ],
         "Resource" : "arn:aws:iam::*:role/CloudreachAWSComplianceRole"
       }
-    ]
+    ], var.report_bucket == "" ? [] : [
+      {
+        "Sid" : "S3ReportsAndFindingsState",
+        "Effect" : "Allow",
+        "Action" : [
+          "s3:PutObject",
+          "s3:GetObject"
+        ],
+        "Resource" : [
+          "arn:aws:s3:::${var.report_bucket}/compliance-reports/*",
+          "arn:aws:s3:::${var.report_bucket}/findings-state/*",
+          "arn:aws:s3:::${var.report_bucket}/shard-results/*"
+        ]
+      },
+      {
+        # Without ListBucket, S3 answers a missing state file with AccessDenied instead of NoSuchKey
+        "Sid" : "S3ListFindingsState",
+        "Effect" : "Allow",
+        "Action" : [
+          "s3:ListBucket"
+        ],
+        "Resource" : "arn:aws:s3:::${var.report_bucket}",
+        "Condition" : {
+          "StringLike" : {
+            "s3:prefix" : "findings-state/*"
+          }
+        }
+      }
+    ], var.sharding_enabled ? [
+      {
+        "Sid" : "SQSWorkUnits",
+        "Effect" : "Allow",
+        "Action" : [
+          "sqs:SendMessage",
+          "sqs:ReceiveMessage",
+          "sqs:DeleteMessage",
+          "sqs:ChangeMessageVisibility",
+          "sqs:GetQueueAttributes"
+        ],
+        "Resource" : aws_sqs_queue.work_units[0].arn
+      },
+      {
+        "Sid" : "S3ListShardResults",
+        "Effect" : "Allow",
+        "Action" : [
+          "s3:ListBucket"
+        ],
+        "Resource" : "arn:aws:s3:::${var.report_bucket}",
+        "Condition" : {
+          "StringLike" : {
+            "s3:prefix" : "shard-results/*"
+          }
+        }
+      }
+    ] : [])
   })
 }
 
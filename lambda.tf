@@ -22,13 +22,57 @@ resource "aws_lambda_function" "audit_lambda" {
 
   environment {
     variables = {
-      EMAIL_FROM = data.aws_ses_email_identity.ses.email # <-- SES verified email address
-      EMAIL_TO   = jsonencode(var.email_recipients)      # <-- Add additional email addresses as needed
+      EMAIL_FROM            = data.aws_ses_email_identity.ses.email # <-- SES verified email address
+      EMAIL_TO              = jsonencode(var.email_recipients)      # <-- Add additional email addresses as needed
+      REPORT_BUCKET         = var.report_bucket                     # <-- Optional, S3 bucket for oversized reports
+      FINDINGS_STATE_BUCKET = var.report_bucket                     # <-- Optional, findings state for delta audits
+      WORK_QUEUE_URL        = var.sharding_enabled ? aws_sqs_queue.work_units[0].url : ""
+      SHARD_RESULTS_BUCKET  = var.sharding_enabled ? var.report_bucket : ""
     }
   }
 
 }
 
+# Work units of sharded audits, each unit is processed by its own invocation
+resource "aws_sqs_queue" "work_units" {
+  count = var.sharding_enabled ? 1 : 0
+  name  = "${var.lambda_function_name}-work-units"
+
+  visibility_timeout_seconds = 960 # <-- Longer than the Lambda timeout, so units are not redelivered while running
+  message_retention_seconds  = 86400
+
+  # Units that keep timing out or failing are set aside instead of being retried for the whole retention period
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.work_units_dlq[0].arn
+    maxReceiveCount     = 3
+  })
+
+  lifecycle {
+    precondition {
+      condition     = var.report_bucket != ""
+      error_message = "sharding_enabled needs report_bucket, partial results of sharded audits are stored there."
+    }
+  }
+}
+
+# Units that could not be processed, a run missing units can be reduced with "force": true
+resource "aws_sqs_queue" "work_units_dlq" {
+  count = var.sharding_enabled ? 1 : 0
+  name  = "${var.lambda_function_name}-work-units-dlq"
+
+  message_retention_seconds = 1209600
+}
+
+resource "aws_lambda_event_source_mapping" "work_units" {
+  count            = var.sharding_enabled ? 1 : 0
+  event_source_arn = aws_sqs_queue.work_units[0].arn
+  function_name    = aws_lambda_function.audit_lambda.arn
+  batch_size       = 1
+
+  # Units that run out of time are retried on their own
+  function_response_types = ["ReportBatchItemFailures"]
+}
+
 # resource "aws_lambda_permission" "allow_cloudwatch_event" {
 #   statement_id  = "AllowExecutionFromCloudWatch"
 #   action        = "lambda:InvokeFunction"
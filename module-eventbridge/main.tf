@@ -12,10 +12,12 @@ resource "aws_cloudwatch_event_target" "lambda_target" {
   role_arn = var.eventbridge_role_arn
 
   input = jsonencode({
-    account_id       = var.account_id,
-    regions          = var.regions,
-    enabled_checks   = local.enabled_checks,
-    exclusions       = local.exclusions
+    account_id             = var.account_id,
+    regions                = var.regions,
+    max_region_concurrency = var.max_region_concurrency,
+    delta_only             = var.delta_only,
+    enabled_checks         = local.enabled_checks,
+    exclusions             = local.exclusions
   })
 
 }
\ No newline at end of file
@@ -28,6 +28,18 @@ variable "regions" {
   description = "List of AWS regions to analyze"
 }
 
+variable "max_region_concurrency" {
+  type        = number
+  default     = 5
+  description = "Maximum number of regions scanned in parallel"
+}
+
+variable "delta_only" {
+  type        = bool
+  default     = false
+  description = "Only report findings that are new or resolved since the previous run"
+}
+
 variable "enable_gp2_check" {
   type        = bool
   default     = false
@@ -50,17 +62,17 @@ variable "enable_sg_check" {
 variable "exclude_gp2_volumes" {
   type        = list(string)
   default     = []
-  description = "List of gp2 volumes to exclude."
+  description = "List of gp2 volumes to exclude. Accepts IDs, prefixes (vol-0abc*), globs and tags (tag:key=value)."
 }
 
 variable "exclude_unencrypted_volumes" {
   type        = list(string)
   default     = []
-  description = "List of unencrypted volumes to exclude."
+  description = "List of unencrypted volumes to exclude. Accepts IDs, prefixes (vol-0abc*), globs and tags (tag:key=value)."
 }
 
 variable "exclude_sg_rules" {
   type        = list(string)
   default     = []
-  description = "List of security group rule IDs to exclude."
+  description = "List of security group rule IDs to exclude. Accepts IDs, prefixes (sgr-0abc*), globs and tags (tag:key=value)."
 }
@@ -2,50 +2,265 @@
 This module contains the Lambda handler for EBS compliance audits.
 It invokes analyzers for unencrypted and gp2 EBS volumes across specified AWS regions,
 and emails the results as CSV attachments.
+
+An event can describe a single account (account_id, regions, enabled_checks, exclusions)
+or a batch of accounts under "accounts", which are audited in parallel.
+Reports are emailed as one digest per account, or one digest for the whole batch
+when the event sets "digest": "batch". With "delta_only": true only findings that
+are new or resolved since the previous run are reported, and "debug": true logs
+every finding instead of a sample. "engine": "async" scans regions as coroutines
+on a shared event loop instead of a thread per region.
+
+"capture_path" records every EC2 page read during the audit to a local capture,
+and "replay_path" audits from such a capture instead of the account, without
+assuming a role or calling AWS. "report_dir" writes the CSV reports to a local
+directory instead of emailing them.
+
+For accounts too large for one invocation, "mode": "coordinate" splits the run
+into (account, region, check) work units on a queue instead of auditing it.
+Workers process the units when invoked by the queue (or with "mode": "work"),
+and the last one merges the results and sends the reports. "mode": "reduce"
+with a "run_id" merges a run by hand, see library.aws.sharded_audit.
 """
-import os
 import json
-import boto3
-from library.aws.ebs_unencrypted_volumes_analyzer import EbsUnencryptedVolumesAnalyzer
-from library.aws.ebs_gp2_analyzer import EbsGP2Analyzer
-from library.aws.security_group_analyzer import SecurityGroupAnalyzer
+import time
+from concurrent.futures import ThreadPoolExecutor
+from library.aws.inventory_capture import CaptureReader, ReplaySession, close_capture_writers, get_capture_writer
+from library.aws.region_inventory import RegionInventory
+from library.aws.registry import registered_checks, get_analyzer
+from library.aws.sharded_audit import coordinate, process_records, reduce, work
 from library.helpers.assume_role import assume_role
-from library.helpers.write_csv import write_csv
+from library.helpers.aws_clients import throttle_metrics
+from library.helpers.logger import log
+from library.helpers.metrics import metrics
+from library.helpers.report_aggregator import ReportAggregator
+from library.helpers.findings_state import get_state_backend, delta_report, save_state_after_send
+
+DEFAULT_MAX_ACCOUNT_CONCURRENCY = 4
+DEFAULT_EXCLUSIONS = {
+    "ebs_gp2_volume_ids": [],
+    "ebs_unencrypted_volume_ids": [],
+    "security_group_rule_ids": []
+}
+# Seconds kept in reserve so results are returned before Lambda times out
+TIMEOUT_MARGIN_SECONDS = 30
 
 
 def lambda_handler(event, context):
     """
     Entry point for the Lambda function.
-    It initializes the analyzers for modules specified in the event.
+    It audits every account in the event, up to max_account_concurrency at a time,
+    and returns the outcome per account. Sharded runs are dispatched on the event's mode.
     """
 
-    account_id = event.get("account_id")
-    regions = event.get("regions", [])
-    enabled_checks = event.get("enabled_checks", [])
-    exclusions = event.get("exclusions", {
-        "ebs_gp2_volume_ids": [],
-        "ebs_unencrypted_volume_ids": [],
-        "security_group_rule_ids": []
-    })
+    invocation_deadline = _invocation_deadline(context)
+    mode = event.get("mode", "audit")
 
-    # Assume role in the target account
-    session = assume_role(account_id)
+    log.configure(level=event.get("log_level"), debug=event.get("debug"))
+    throttle_metrics.reset()
+    metrics.reset()
 
-    print(f"Running for account: {account_id}, Compliance checks in Scope: {enabled_checks}, regions: {regions}")
+    body = {}
+    try:
+        if event.get("Records"):
+            # Work units delivered by the SQS event source mapping
+            body = process_records(event["Records"], invocation_deadline)
+        elif mode == "coordinate":
+            body = coordinate(account_events(event), event.get("digest"), run_id=event.get("run_id"))
+        elif mode == "work":
+            body = work(invocation_deadline, max_units=event.get("max_units"))
+        elif mode == "reduce":
+            body = reduce(event["run_id"], force=event.get("force", False))
+        else:
+            body = audit_accounts(event, invocation_deadline)
+    except Exception as e:
+        log.error(f"Invocation failed: {e}", mode=mode)
+        raise
+    finally:
+        # Also runs when dispatch raises, so buffered logs and metrics are written and not carried into the next run
+        close_capture_writers()
+        throttles = throttle_metrics.summary()
+        log.info(f"Throttling: {throttles['throttled_calls']} throttled calls, "
+                 f"{throttles['rate_limiter_wait_seconds']}s waited on rate limiters", throttling=throttles)
+        metrics.add('ThrottledCalls', throttles['throttled_calls'])
+        metrics.add('RateLimiterWait', throttles['rate_limiter_wait_seconds'], 'Seconds')
+        metrics.add('AccountsFailed', sum(result['status'] != 'completed' for result in body.get('accounts', [])))
+        log.close_run()
+        metrics.flush()
 
-    if "ebs_unencrypted" in enabled_checks:
-        ebs_unecrypted_volumes = EbsUnencryptedVolumesAnalyzer(account_id, session, exclusions).analyze(regions)
-        write_csv(ebs_unecrypted_volumes)
+    if event.get("Records"):
+        # The event source mapping reads batchItemFailures from the top level of the response
+        return body
+    return {
+        'statusCode': 200,
+        'body': json.dumps({**body, 'throttling': throttles})
+    }
 
-    if "ebs_gp2" in enabled_checks:
-        ebs_gp2_volumes = EbsGP2Analyzer(account_id, session, exclusions).analyze(regions)
-        write_csv(ebs_gp2_volumes)
 
-    if "security_groups" in enabled_checks:
-        security_groups = SecurityGroupAnalyzer(account_id, session, exclusions).analyze(regions)
-        write_csv(security_groups)
+def account_events(event):
+    """
+    Returns the settings of every account in the event, top-level settings act as defaults for each.
+    """
+    accounts = event.get("accounts") or [{"account_id": event.get("account_id")}]
+    defaults = {key: value for key, value in event.items() if key not in ("accounts", "mode", "run_id")}
+    return [{**defaults, **account} for account in accounts]
+
+
+def audit_accounts(event, invocation_deadline=None):
+    """
+    Audits every account in the event in this invocation.
+
+    Returns:
+        dict: Response body with the outcome per account.
+    """
+    accounts = account_events(event)
+    max_workers = event.get("max_account_concurrency") or DEFAULT_MAX_ACCOUNT_CONCURRENCY
+    time_budget = event.get("account_timeout_seconds")
+    log.info(f"Auditing {len(accounts)} account(s), {max_workers} at a time")
+
+    # A shared aggregator collects every account's reports into one email
+    batch_aggregator = ReportAggregator(report_dir=event.get("report_dir")) if event.get("digest") == "batch" else None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(accounts)))) as executor:
+        results = list(executor.map(
+            lambda account: audit_account(account, time_budget, invocation_deadline, batch_aggregator),
+            accounts
+        ))
+
+    if batch_aggregator:
+        try:
+            batch_aggregator.send()
+        except Exception as e:
+            # Nothing reached the recipients, so no account in the batch completed
+            results = [{**result, 'status': 'failed', 'errors': result.get('errors', []) + [str(e)]}
+                       if result['status'] == 'completed' else result for result in results]
 
     return {
-        'statusCode': 200,
-        'body': json.dumps('Compliance module execution complete.')
+        'message': 'Compliance module execution complete.',
+        'accounts': results
     }
+
+
+def audit_account(account, time_budget=None, invocation_deadline=None, aggregator=None):
+    """
+    Runs the enabled checks for a single account and emails the reports.
+    Failures and overruns are captured in the result, so other accounts in the batch are unaffected.
+
+    Args:
+        account (dict): Account settings (account_id, regions, enabled_checks, exclusions, ...).
+        time_budget (float): Seconds the account may spend scanning, None for no limit.
+        invocation_deadline (float): time.monotonic() value by which every account must stop.
+        aggregator (ReportAggregator): Batch digest to add reports to, None to email this account on its own.
+
+    Returns:
+        dict: Outcome of the audit with status, finding counts and errors.
+    """
+    account_id = account.get("account_id")
+    regions = account.get("regions", [])
+    enabled_checks = account.get("enabled_checks", [])
+    exclusions = account.get("exclusions", DEFAULT_EXCLUSIONS)
+    # Extra keyword arguments per check, e.g. {"security_groups": {"policy": {...}}}
+    check_options = account.get("check_options", {})
+    started = time.monotonic()
+    deadlines = [started + time_budget if time_budget else None, invocation_deadline]
+    deadline = min([value for value in deadlines if value is not None], default=None)
+
+    log.info(f"Running for account: {account_id}, Compliance checks in Scope: {enabled_checks}, regions: {regions}")
+
+    try:
+        if account.get("replay_path"):
+            # Replayed audits read the captured inventory, regions default to every captured one
+            session = ReplaySession(CaptureReader(account["replay_path"]), account_id)
+            regions = regions or session.regions()
+        else:
+            # Assume role in the target account
+            with metrics.timer('AssumeRole', account_id=account_id):
+                session = assume_role(account_id)
+        capture = get_capture_writer(account["capture_path"]) if account.get("capture_path") else None
+
+        # Shared inventory, records are streamed once per region and fanned out to every enabled analyzer
+        inventory_class = RegionInventory
+        if account.get("engine") == "async":
+            # Imported on demand, asyncio and aiobotocore are not loaded for threaded runs
+            from library.aws.async_inventory import AsyncRegionInventory
+            inventory_class = AsyncRegionInventory
+        inventory = inventory_class(
+            session,
+            account_id=account_id,
+            page_size=account.get("page_size"),
+            max_workers=account.get("max_region_concurrency"),
+            deadline=deadline,
+            capture=capture
+        )
+
+        # Analyzer modules are imported here, only for the checks this account enables
+        analyzers = {}
+        for check in registered_checks():
+            if check in enabled_checks:
+                options = check_options.get(check, {})
+                analyzers[check] = get_analyzer(check)(account_id, session, exclusions, inventory, **options)
+
+        unknown_checks = [check for check in enabled_checks if check not in analyzers]
+        if unknown_checks:
+            log.warning(f"Account {account_id}: ignoring unknown compliance checks {unknown_checks}", account_id=account_id)
+
+        with metrics.timer('Scan', account_id=account_id):
+            inventory.scan(regions, list(analyzers.values()))
+    except Exception as e:
+        # e.g. a role that cannot be assumed, or check options an analyzer rejects
+        log.error(f"Account {account_id}: audit failed: {e}", account_id=account_id)
+        return {'account_id': account_id, 'status': 'failed', 'errors': [str(e)]}
+
+    log.info(f"Inventory: {inventory.api_calls} EC2 describe calls made across {len(regions)} regions",
+             account_id=account_id, api_calls=inventory.api_calls)
+
+    errors = [f"Unknown compliance check: {check}" for check in unknown_checks]
+    errors += [error for analyzer in analyzers.values() for error in analyzer.errors]
+    if inventory.timed_out:
+        # Partial findings would under-report, so nothing is emailed for an account that ran out of time
+        log.warning(f"Account {account_id}: time budget exhausted, reports not sent", account_id=account_id)
+        return {'account_id': account_id, 'status': 'timed_out', 'errors': errors}
+
+    account_aggregator = aggregator or ReportAggregator(report_dir=account.get("report_dir"))
+    findings = {}
+    reports = []
+    states = {}
+    try:
+        state_backend = get_state_backend() if account.get("delta_only") else None
+        for check, analyzer in analyzers.items():
+            with metrics.timer('Report', account_id=account_id, check=check):
+                report = analyzer.report(regions)
+            findings[check] = len(report["csv_data"]) if report else 0
+            if state_backend:
+                report, states[check] = delta_report(state_backend, account_id, check, analyzer.FINDING_ID, report,
+                                                     complete=not analyzer.errors)
+            reports.append(report)
+
+        # Reports join a batch digest only once all of them are built, a failed account adds none
+        for report in reports:
+            account_aggregator.add(account_id, report)
+        # The findings state is saved once the digest is sent, so a failed send reports the same changes next run
+        for check, state in states.items():
+            save_state_after_send(account_aggregator, state_backend, account_id, check, state)
+        if aggregator is None:
+            account_aggregator.send()
+    except Exception as e:
+        log.error(f"Account {account_id}: reporting failed: {e}", account_id=account_id)
+        return {'account_id': account_id, 'status': 'failed', 'findings': findings, 'errors': errors + [str(e)]}
+
+    return {
+        'account_id': account_id,
+        'status': 'completed',
+        'findings': findings,
+        'errors': errors,
+        'duration_seconds': round(time.monotonic() - started, 2)
+    }
+
+
+def _invocation_deadline(context):
+    """
+    Returns the time.monotonic() value at which scanning must stop to finish within the Lambda timeout.
+    """
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        return None
+    return time.monotonic() + context.get_remaining_time_in_millis() / 1000 - TIMEOUT_MARGIN_SECONDS
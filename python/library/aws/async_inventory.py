@@ -0,0 +1,169 @@
+"""
+Async Region Inventory
+
+This module is an optional scan engine that pages describe_volumes and
+describe_security_group_rules as coroutines instead of one thread per region.
+Every account's scan runs on one shared event loop, and a single semaphore caps
+the API calls in flight across all accounts and regions, so a large fan-out
+costs a few idle coroutines rather than hundreds of idle threads.
+
+Pages are fetched with aiobotocore when it is installed. Without it, the sync
+clients are paged from the engine's own thread pool, sized to the concurrency
+cap, so the cap holds for local runs, the benchmark stub and Lambda packages
+without aiobotocore. Both clients report throttles and call metrics the same way.
+
+Pages are handed to the existing analyzers on the loop's default executor,
+so every check works with either engine and evaluating a large page
+does not hold up paging for other regions. Select it per account with "engine": "async".
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from library.aws.region_inventory import RegionInventory, RESOURCE_APIS
+from library.helpers.aws_clients import RETRY_MAX_ATTEMPTS, get_rate_limiter, instrument_client, throttle_metrics
+from library.helpers.metrics import metrics
+
+try:
+    from aiobotocore.config import AioConfig
+    from aiobotocore.session import get_session as get_aio_session
+except ImportError:
+    get_aio_session = None
+
+# API calls in flight at once, across every account and region on the loop
+ASYNC_MAX_CONCURRENCY = int(os.environ.get('ASYNC_MAX_CONCURRENCY', 50))
+
+
+class AsyncScanEngine:
+    """
+    Event loop running on a background thread, shared by every account scanned in the process.
+
+    Args:
+        max_concurrency (int): API calls allowed in flight at once.
+    """
+
+    def __init__(self, max_concurrency=ASYNC_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.loop = asyncio.new_event_loop()
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        # Sync clients block a thread per call, the default executor would cap them at a handful of threads
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="async-scan-fetch")
+        self.aio_session = get_aio_session() if get_aio_session else None
+        self.thread = threading.Thread(target=self.loop.run_forever, name="async-scan-engine", daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine):
+        """
+        Runs a coroutine on the engine's loop and blocks the calling thread until it completes.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """
+    Returns the process-wide scan engine, starting it on first use.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncScanEngine()
+        return _engine
+
+
+class AsyncRegionInventory(RegionInventory):
+    """
+    Region inventory whose scan() pages every region as a coroutine on the shared engine.
+    Arguments are the same as for RegionInventory, max_workers is not used.
+    """
+
+    def scan(self, region_list, analyzers):
+        """
+        Sweeps each region once per resource type and passes every record
+        to all analyzers that consume it. Regions are scanned concurrently on
+        the engine's loop, errors are isolated per region and recorded on
+        each affected analyzer.
+
+        Args:
+            region_list (List[str]): A list of AWS regions to scan.
+            analyzers (list): Analyzers exposing RESOURCE, API_FILTERS, FINDINGS, evaluate() and errors.
+        """
+        engine = get_engine()
+        get_credentials = getattr(self.session, 'get_credentials', None)
+        # Captured scans page the sync clients from the executor, so the capturing wrapper sees every page
+        use_aio = engine.aio_session and get_credentials and not self.capture
+        credentials = get_credentials() if use_aio else None
+        # aiobotocore clients cannot refresh our credentials, they are frozen for the length of the scan
+        frozen = credentials.get_frozen_credentials() if credentials else None
+
+        engine.run(self._scan(engine, region_list, analyzers, frozen))
+        self.sort_findings(region_list, analyzers)
+
+    async def _scan(self, engine, region_list, analyzers, credentials):
+        await asyncio.gather(*(
+            self._scan_region_async(engine, region, analyzers, credentials) for region in region_list
+        ))
+
+    async def _scan_region_async(self, engine, region, analyzers, credentials):
+        loop = asyncio.get_running_loop()
+        with metrics.timer('RegionScan', account_id=self.account_id, region=region, engine='async'):
+            for resource, consumers in self._consumers(analyzers):
+                filters = self._shared_filters(consumers)
+                if credentials:
+                    pages = self._aio_pages(engine, resource, region, filters, credentials)
+                else:
+                    pages = self._executor_pages(engine, resource, region, filters)
+                with self._region_errors(region, consumers):
+                    async for records in pages:
+                        # Analyzer work runs off the loop, so a large page does not stall paging elsewhere
+                        await loop.run_in_executor(None, self._evaluate_page, records, region, consumers)
+
+    async def _aio_pages(self, engine, resource, region, filters, credentials):
+        operation, response_key = RESOURCE_APIS[resource]
+        limiter = get_rate_limiter('ec2', region, self.account_id)
+        config = AioConfig(retries={'max_attempts': RETRY_MAX_ATTEMPTS, 'mode': 'adaptive'})
+        async with engine.aio_session.create_client(
+            'ec2',
+            region_name=region,
+            aws_access_key_id=credentials.access_key,
+            aws_secret_access_key=credentials.secret_key,
+            aws_session_token=credentials.token,
+            config=config
+        ) as client:
+            instrument_client(client, 'ec2')
+            pages = client.get_paginator(operation).paginate(**self._page_request(operation, filters)).__aiter__()
+            while True:
+                # Checked before each request, the page just yielded has been evaluated
+                self._check_deadline(operation)
+                if limiter is not None:
+                    wait = limiter.reserve()
+                    if wait:
+                        throttle_metrics.record_wait('ec2', region, wait)
+                        await asyncio.sleep(wait)
+                # The semaphore is held for one call at a time, so regions take turns under the global cap
+                async with engine.semaphore:
+                    try:
+                        page = await pages.__anext__()
+                    except StopAsyncIteration:
+                        return
+                self._count_page()
+                yield page[response_key]
+
+    async def _executor_pages(self, engine, resource, region, filters):
+        # Without aiobotocore, the sync paginator is advanced one page at a time on the engine's executor
+        loop = asyncio.get_running_loop()
+        pages = self.iter_pages(resource, region, filters)
+        try:
+            while True:
+                async with engine.semaphore:
+                    records = await loop.run_in_executor(engine.executor, next, pages, None)
+                if records is None:
+                    return
+                yield records
+        finally:
+            pages.close()
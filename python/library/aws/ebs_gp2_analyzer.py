@@ -5,20 +5,52 @@ This module checks for EBS volumes that are gp2 type. It generates
 a CSV report and sends it via SES to designated recipients.
 """
 
-import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
+from library.aws.instance_enricher import attached_instances
+from library.aws.region_inventory import RegionInventory
+from library.aws.registry import register_analyzer
+from library.helpers.exclusions import ExclusionRules
+from library.helpers.finding_record import FindingRecord
+from library.helpers.logger import log
 
 
+class GP2VolumeFinding(FindingRecord):
+    """
+    A gp2 volume in the report.
+    """
+
+    COLUMNS = (
+        ('account_id', 'Account ID'),
+        ('region', 'Region'),
+        ('availability_zone', 'Availability Zone'),
+        ('volume_id', 'Volume ID'),
+        ('volume_type', 'Type'),
+        ('attached_instances', 'Attached Instances'),
+        ('instance_names', 'Instance Names'),
+        ('instance_states', 'Instance States'),
+        ('iops', 'IOPS'),
+        ('size', 'Size'),
+    )
+    __slots__ = tuple(attribute for attribute, _ in COLUMNS)
+
+
+@register_analyzer("ebs_gp2")
 class EbsGP2Analyzer:
     """
     Identifies EBS volumes still using gp2 and generates reports.
     """
 
-    def __init__(self, account_id, session, exclusions):
+    RESOURCE = 'volumes'
+    API_FILTERS = [{'Name': 'volume-type', 'Values': ['gp2']}]
+    FINDING_ID = 'Volume ID'
+    FINDINGS = 'gp2_volumes'
+
+    def __init__(self, account_id, session, exclusions, inventory=None):
         self.account_id = account_id
         self.session = session
-        self.excluded_volumes = exclusions.get('ebs_gp2_volume_ids', [])
+        self.inventory = inventory or RegionInventory(session)
+        self.excluded_volumes = ExclusionRules(exclusions.get('ebs_gp2_volume_ids', []))
         self.gp2_volumes = []
+        self.errors = []
         self.excluded_volumes_count = 0  # Track how many volumes were excluded
 
     def analyze(self, region_list):
@@ -28,54 +60,31 @@ class EbsGP2Analyzer:
         Args:
             region_list (List[str]): A list of AWS regions to scan.
         """
-        print("EBS: Analyzing GP2 volumes...")
+        log.info("EBS: Analyzing GP2 volumes...")
         # print(f"EBS: Excluding {len(self.excluded_volumes)} gp2 volumes from analysis")
 
-        # Loop through Regions
-        for region in region_list:
-
-            ebs = self.session.client('ec2', region_name=region)
-            volumes = ebs.describe_volumes()['Volumes']
-
-            for volume in volumes:
-                if volume['VolumeId'] in self.excluded_volumes:
-                    self.excluded_volumes_count += 1
-                    print(f"Skipping excluded volume {volume['VolumeId']}")
-                    continue  # Skip excluded volumes
-                volume_id = volume['VolumeId']
-                volume_type = volume['VolumeType']
-                volume_state = volume['State']
-                volume_size = volume['Size']
-                availability_zone = volume['AvailabilityZone']
-                vol_attachments = ''
-                iops = volume['Iops']
-                volume_tags = volume.get('Tags', [])
-                if volume_type == 'gp2':
-                    if volume_state == 'in-use':
-                        vol_attachments = volume['Attachments'][0]['InstanceId']
-                    self.gp2_volumes.append({
-                        'Account ID': self.account_id,
-                        'Region': region,
-                        'Availability Zone': availability_zone,
-                        'Volume ID': volume_id,
-                        'Type': volume_type,
-                        'Attached Instances': vol_attachments,
-                        'IOPS': iops,
-                        'Size': volume_size,
-                    })
-        print("EBS: GP2 volumes analysis complete")
-        print(f"EBS: Found {len(self.gp2_volumes)} gp2 volumes across {len(region_list)} regions.")
-        print(f"EBS: Excluded {self.excluded_volumes_count} volumes from the report based on exclusion list.")
-        
-        print(self.gp2_volumes)
-        print(f"""EBS GP2 Summary:
-            - Total gp2 volumes found: {len(self.gp2_volumes)}
-            - Excluded volumes from report: {self.excluded_volumes_count}
-            - Regions scanned: {len(region_list)}
-        """)
+        self.inventory.scan(region_list, [self])
+        return self.report(region_list)
+
+    def report(self, region_list):
+        """
+        Summarizes the findings and builds the report for the email module.
+
+        Args:
+            region_list (List[str]): The AWS regions that were scanned.
+        """
+        self.inventory.instances.enrich(self.gp2_volumes)
+        log.info(
+            f"EBS: Found {len(self.gp2_volumes)} gp2 volumes across {len(region_list)} regions.",
+            check="ebs_gp2",
+            account_id=self.account_id,
+            regions_scanned=len(region_list),
+            excluded=self.excluded_volumes_count,
+            excluded_by_rule=dict(self.excluded_volumes.counts.most_common())
+        )
+        log.findings("ebs_gp2", self.gp2_volumes)
 
         if not self.gp2_volumes:
-            print("EBS: No GP2 volumes found.")
             return
         return {
             "subject": f'GP2 Volumes Detected in AWS Account - {self.account_id}',
@@ -99,22 +108,33 @@ class EbsGP2Analyzer:
             "csv_data": self.gp2_volumes,
             "filename": f"ebs-gp2-volumes-{self.account_id}.csv"
         }
-        
-
-
-
 
-# class EbsGP2Analyzer:
-#     def __init__(self, account_id, session):
-#         self.account_id = account_id
-#         self.session = session
+    def evaluate(self, volume, region):
+        """
+        Evaluate a single volume and record it if it is gp2.
 
-#     def analyze(self, regions):
-#         results = []
-#         for region in regions:
-#             ec2 = self.session.client("ec2", region_name=region)
-#             volumes = ec2.describe_volumes(
-#                 Filters=[{"Name": "volume-type", "Values": ["gp2"]}]
-#             )["Volumes"]
-#             # ... process and populate results
-#         return results
\ No newline at end of file
+        Args:
+            volume (dict): Volume data streamed from the region inventory
+            region (str): AWS region name
+        """
+        volume_id = volume['VolumeId']
+        volume_type = volume['VolumeType']
+        volume_size = volume['Size']
+        availability_zone = volume['AvailabilityZone']
+        iops = volume['Iops']
+        volume_tags = volume.get('Tags', [])
+        if volume_type == 'gp2':
+            if self.excluded_volumes.is_excluded(volume_id, volume_tags):
+                self.excluded_volumes_count += 1
+                log.sampled("ebs_gp2.excluded", "INFO", f"Skipping excluded volume {volume_id}")
+                return  # Skip excluded volumes
+            self.gp2_volumes.append(GP2VolumeFinding(
+                account_id=self.account_id,
+                region=region,
+                availability_zone=availability_zone,
+                volume_id=volume_id,
+                volume_type=volume_type,
+                attached_instances=attached_instances(volume),
+                iops=iops,
+                size=volume_size,
+            ))
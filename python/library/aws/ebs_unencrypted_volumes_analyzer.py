@@ -5,21 +5,54 @@ This module checks for unencrypted EBS volumes. It generates
 a CSV report and sends it via SES to designated recipients.
 """
 
-import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
+from library.aws.instance_enricher import attached_instances
+from library.aws.region_inventory import RegionInventory
+from library.aws.registry import register_analyzer
+from library.helpers.exclusions import ExclusionRules
+from library.helpers.finding_record import FindingRecord
+from library.helpers.logger import log
 
 
+class UnencryptedVolumeFinding(FindingRecord):
+    """
+    An unencrypted volume in the report.
+    """
+
+    COLUMNS = (
+        ('account_id', 'Account ID'),
+        ('region', 'Region'),
+        ('availability_zone', 'Availability Zone'),
+        ('volume_id', 'Volume ID'),
+        ('encrypted', 'Encrypted'),
+        ('volume_type', 'Type'),
+        ('attached_instances', 'Attached Instances'),
+        ('instance_names', 'Instance Names'),
+        ('instance_states', 'Instance States'),
+        ('iops', 'IOPS'),
+        ('size', 'Size'),
+    )
+    __slots__ = tuple(attribute for attribute, _ in COLUMNS)
+
+
+@register_analyzer("ebs_unencrypted")
 class EbsUnencryptedVolumesAnalyzer:
     """
     Analyzes AWS accounts and regions for EBS volumes that are not encrypted.
     Collects data and sends a CSV report via SES.
     """
 
-    def __init__(self, account_id, session, exclusions):
+    RESOURCE = 'volumes'
+    API_FILTERS = [{'Name': 'encrypted', 'Values': ['false']}]
+    FINDING_ID = 'Volume ID'
+    FINDINGS = 'unencrypted_volumes'
+
+    def __init__(self, account_id, session, exclusions, inventory=None):
         self.account_id = account_id
         self.session = session
-        self.excluded_volumes = exclusions.get('ebs_unencrypted_volume_ids', [])
+        self.inventory = inventory or RegionInventory(session)
+        self.excluded_volumes = ExclusionRules(exclusions.get('ebs_unencrypted_volume_ids', []))
         self.unencrypted_volumes = []
+        self.errors = []
         self.excluded_volumes_count = 0  # Track how many volumes were excluded
 
     def analyze(self, region_list):
@@ -29,55 +62,31 @@ class EbsUnencryptedVolumesAnalyzer:
         Args:
             region_list (List[str]): A list of AWS regions to scan.
         """
-        print("EBS: Analyzing Unecrypted volumes...")
+        log.info("EBS: Analyzing Unecrypted volumes...")
         # print(f"EBS: Excluding {len(self.excluded_volumes)} unencrypted volumes from analysis")
 
-        # Loop through Regions
-        for region in region_list:
-            ebs = self.session.client('ec2', region_name=region)
-            volumes = ebs.describe_volumes()['Volumes']
-
-            for volume in volumes:
-                if volume['VolumeId'] in self.excluded_volumes:
-                    self.excluded_volumes_count += 1
-                    print(f"Skipping excluded volume {volume['VolumeId']}")
-                    continue  # Skip if volume in exclusion list
-                volume_id = volume['VolumeId']
-                encrypted = volume['Encrypted']
-                volume_type = volume['VolumeType']
-                volume_state = volume['State']
-                volume_size = volume['Size']
-                vol_attachments = ''
-                iops = volume['Iops']
-                volume_tags = volume.get('Tags', [])
-                availability_zone = volume['AvailabilityZone']
-                if volume_state == 'in-use':
-                    vol_attachments = volume['Attachments'][0]['InstanceId']
-                if encrypted is False:
-                    self.unencrypted_volumes.append({
-                        'Account ID': self.account_id,
-                        'Region': region,
-                        'Availability Zone': availability_zone,
-                        'Volume ID': volume_id,
-                        'Encrypted': encrypted,
-                        'Type': volume_type,
-                        'Attached Instances': vol_attachments,
-                        'IOPS': iops,
-                        'Size': volume_size,
-                    })
-        print("EBS: Unencrypted volumes analysis complete")
-        print(f"EBS: Found {len(self.unencrypted_volumes)} unencrypted volumes across {len(region_list)} regions.")
-        print(f"EBS: Excluded {self.excluded_volumes_count} volumes from the report based on exclusion list.")
-
-        print(self.unencrypted_volumes)
-        print(f"""EBS Encryption Summary:
-            - Total unencrypted volumes found: {len(self.unencrypted_volumes)}
-            - Excluded volumes from report: {self.excluded_volumes_count}
-            - Regions scanned: {len(region_list)}
-        """)
+        self.inventory.scan(region_list, [self])
+        return self.report(region_list)
+
+    def report(self, region_list):
+        """
+        Summarizes the findings and builds the report for the email module.
+
+        Args:
+            region_list (List[str]): The AWS regions that were scanned.
+        """
+        self.inventory.instances.enrich(self.unencrypted_volumes)
+        log.info(
+            f"EBS: Found {len(self.unencrypted_volumes)} unencrypted volumes across {len(region_list)} regions.",
+            check="ebs_unencrypted",
+            account_id=self.account_id,
+            regions_scanned=len(region_list),
+            excluded=self.excluded_volumes_count,
+            excluded_by_rule=dict(self.excluded_volumes.counts.most_common())
+        )
+        log.findings("ebs_unencrypted", self.unencrypted_volumes)
 
         if not self.unencrypted_volumes:
-            print("EBS: No unencrypted volumes found.")
             return
         return {
             "csv_data": self.unencrypted_volumes,
@@ -102,6 +111,35 @@ class EbsUnencryptedVolumesAnalyzer:
             Atos Managed Services
           """
         }
- 
 
-   
\ No newline at end of file
+    def evaluate(self, volume, region):
+        """
+        Evaluate a single volume and record it if it is not encrypted.
+
+        Args:
+            volume (dict): Volume data streamed from the region inventory
+            region (str): AWS region name
+        """
+        volume_id = volume['VolumeId']
+        encrypted = volume['Encrypted']
+        volume_type = volume['VolumeType']
+        volume_size = volume['Size']
+        iops = volume['Iops']
+        volume_tags = volume.get('Tags', [])
+        availability_zone = volume['AvailabilityZone']
+        if encrypted is False:
+            if self.excluded_volumes.is_excluded(volume_id, volume_tags):
+                self.excluded_volumes_count += 1
+                log.sampled("ebs_unencrypted.excluded", "INFO", f"Skipping excluded volume {volume_id}")
+                return  # Skip if volume in exclusion list
+            self.unencrypted_volumes.append(UnencryptedVolumeFinding(
+                account_id=self.account_id,
+                region=region,
+                availability_zone=availability_zone,
+                volume_id=volume_id,
+                encrypted=encrypted,
+                volume_type=volume_type,
+                attached_instances=attached_instances(volume),
+                iops=iops,
+                size=volume_size,
+            ))
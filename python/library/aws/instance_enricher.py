@@ -0,0 +1,97 @@
+"""
+Instance Enricher
+
+This module resolves the EC2 instances EBS volumes are attached to, so reports
+can show each instance's Name tag and state. Instance IDs are gathered from all
+findings first and resolved with batched, paginated describe_instances calls,
+and the results are cached for the rest of the run.
+"""
+
+import threading
+
+from library.helpers.logger import log
+
+# describe_instances accepts up to 200 values per filter
+DESCRIBE_BATCH_SIZE = 200
+ATTACHMENT_SEPARATOR = ';'
+
+
+def attached_instances(volume):
+    """
+    Returns the IDs of the instances a volume is attached to, joined for the report's
+    Attached Instances column. Multi-attach io1/io2 volumes can be attached to several.
+
+    Args:
+        volume (dict): Volume as returned by describe_volumes.
+    """
+    if volume['State'] != 'in-use':
+        return ''
+    return ATTACHMENT_SEPARATOR.join(attachment['InstanceId'] for attachment in volume.get('Attachments', []))
+
+
+class InstanceEnricher:
+    """
+    Per-run cache of instance details, shared by the analyzers of one account.
+    """
+
+    def __init__(self, inventory):
+        self.inventory = inventory
+        self.instances = {}  # (region, instance ID) -> {'name': ..., 'state': ...}
+        self.lock = threading.Lock()
+
+    def resolve(self, region, instance_ids):
+        """
+        Fetches details for the instances not cached yet, in batches.
+
+        Args:
+            region (str): AWS region name.
+            instance_ids (Iterable[str]): IDs of the instances to resolve.
+        """
+        with self.lock:
+            missing = sorted({instance_id for instance_id in instance_ids if (region, instance_id) not in self.instances})
+        if not missing:
+            return
+
+        paginator = self.inventory.client(region).get_paginator('describe_instances')
+        for start in range(0, len(missing), DESCRIBE_BATCH_SIZE):
+            batch = missing[start:start + DESCRIBE_BATCH_SIZE]
+            for page in paginator.paginate(Filters=[{'Name': 'instance-id', 'Values': batch}]):
+                with self.inventory.lock:
+                    self.inventory.api_calls += 1
+                for reservation in page['Reservations']:
+                    for instance in reservation['Instances']:
+                        tags = {tag['Key']: tag['Value'] for tag in instance.get('Tags', [])}
+                        with self.lock:
+                            self.instances[(region, instance['InstanceId'])] = {
+                                'name': tags.get('Name', ''),
+                                'state': instance.get('State', {}).get('Name', '')
+                            }
+
+    def enrich(self, findings):
+        """
+        Fills in the instance names and states of EBS findings from their attached instances.
+
+        Args:
+            findings (List[FindingRecord]): Findings with region, attached_instances,
+                instance_names and instance_states attributes.
+        """
+        attached = {}
+        for finding in findings:
+            for instance_id in self._instance_ids(finding):
+                attached.setdefault(finding.region, set()).add(instance_id)
+
+        for region, instance_ids in attached.items():
+            try:
+                self.resolve(region, instance_ids)
+            except Exception as e:
+                log.warning(f"EBS: Could not get instance details in {region}: {e}")
+
+        for finding in findings:
+            details = [self.instances.get((finding.region, instance_id), {}) for instance_id in self._instance_ids(finding)]
+            finding.instance_names = ATTACHMENT_SEPARATOR.join(detail.get('name', '') for detail in details)
+            finding.instance_states = ATTACHMENT_SEPARATOR.join(detail.get('state', '') for detail in details)
+
+    @staticmethod
+    def _instance_ids(finding):
+        attachments = finding.attached_instances
+        return attachments.split(ATTACHMENT_SEPARATOR) if attachments else []
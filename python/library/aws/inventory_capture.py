@@ -0,0 +1,282 @@
+"""
+Inventory Capture
+
+This module records the raw EC2 pages an audit reads and replays them later
+without AWS, so policy or exclusion changes can be re-evaluated over historical
+inventory in seconds, and benchmarks can run on real account shapes.
+
+A capture is two append-only files:
+    <path>        frames of one page each, a 4-byte big-endian length followed
+                  by the zlib-compressed JSON list of records
+    <path>.index  one JSON line per frame with its account, region, API
+                  operation, offset and length
+
+Frames are only indexed once fully written, so a run interrupted mid-write
+leaves a readable capture. Timestamps such as CreateTime are stored as strings.
+"""
+
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+# Response key holding the records of each captured operation
+RESPONSE_KEYS = {
+    'describe_volumes': 'Volumes',
+    'describe_security_group_rules': 'SecurityGroupRules',
+    'describe_instances': 'Reservations',
+    'describe_security_groups': 'SecurityGroups',
+}
+
+# EC2 filter name -> record field, applied when replaying filtered requests
+FILTER_FIELDS = {
+    'volume-type': 'VolumeType',
+    'encrypted': 'Encrypted',
+    'instance-id': 'InstanceId',
+    'group-id': 'GroupId',
+}
+
+FRAME_HEADER = struct.Struct('>I')
+
+
+class CaptureWriter:
+    """
+    Appends pages to a capture. Use get_capture_writer, so accounts audited in
+    parallel share one writer per file.
+
+    Args:
+        path (str): Path of the capture data file, the index is written next to it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.data_file = open(path, 'ab')
+        self.index_file = open(f"{path}.index", 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+
+    def append(self, account_id, region, operation, records):
+        """
+        Writes one page of records and indexes it.
+
+        Args:
+            account_id (str): AWS Account ID the page was read from.
+            region (str): AWS region name.
+            operation (str): Paginated EC2 operation, e.g. 'describe_volumes'.
+            records (List[dict]): Records of the page.
+        """
+        frame = zlib.compress(json.dumps(records, default=str, separators=(',', ':')).encode('utf-8'))
+        with self.lock:
+            offset = self.data_file.seek(0, os.SEEK_END)
+            self.data_file.write(FRAME_HEADER.pack(len(frame)) + frame)
+            self.data_file.flush()
+            self.index_file.write(json.dumps({
+                'account_id': account_id,
+                'region': region,
+                'operation': operation,
+                'offset': offset,
+                'length': len(frame),
+                'records': len(records),
+                'captured_at': round(time.time(), 3),
+            }) + "\n")
+            self.index_file.flush()
+
+    def close(self):
+        with self.lock:
+            self.data_file.close()
+            self.index_file.close()
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_capture_writer(path):
+    """
+    Returns the writer for a capture path, opening it on first use.
+    """
+    with _writers_lock:
+        if path not in _writers:
+            _writers[path] = CaptureWriter(path)
+        return _writers[path]
+
+
+def close_capture_writers():
+    """
+    Closes every open capture, called at the end of each invocation.
+    """
+    with _writers_lock:
+        for writer in _writers.values():
+            writer.close()
+        _writers.clear()
+
+
+class CaptureReader:
+    """
+    Reads pages back from a capture by (account, region, operation).
+
+    Args:
+        path (str): Path of the capture data file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}  # (account ID, region, operation) -> [(offset, length, records)]
+        with open(f"{path}.index", encoding='utf-8') as index_file:
+            for line in index_file:
+                entry = json.loads(line)
+                key = (entry['account_id'], entry['region'], entry['operation'])
+                self.index.setdefault(key, []).append((entry['offset'], entry['length'], entry['records']))
+
+    def accounts(self):
+        """
+        Returns the account IDs in the capture.
+        """
+        return sorted({account_id for account_id, _, _ in self.index})
+
+    def regions(self, account_id):
+        """
+        Returns the regions captured for an account.
+        """
+        return sorted({region for account, region, _ in self.index if account == account_id})
+
+    def record_count(self, account_id, operation):
+        """
+        Returns how many records of an operation were captured for an account.
+        """
+        return sum(
+            records
+            for (account, _, captured_operation), frames in self.index.items()
+            if account == account_id and captured_operation == operation
+            for _, _, records in frames
+        )
+
+    def iter_pages(self, account_id, region, operation):
+        """
+        Yields the captured pages of an operation, in the order they were read.
+        """
+        frames = self.index.get((account_id, region, operation), [])
+        if not frames:
+            return
+        with open(self.path, 'rb') as data_file:
+            for offset, length, _ in frames:
+                data_file.seek(offset + FRAME_HEADER.size)
+                yield json.loads(zlib.decompress(data_file.read(length)))
+
+
+class CapturingClient:
+    """
+    Wraps an EC2 client so every page read through its paginators is also written to a capture.
+    """
+
+    def __init__(self, client, writer, account_id):
+        self.client = client
+        self.writer = writer
+        self.account_id = account_id
+        self.meta = client.meta
+
+    def get_paginator(self, operation):
+        return CapturingPaginator(self, operation)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class CapturingPaginator:
+    def __init__(self, capturing_client, operation):
+        self.capturing_client = capturing_client
+        self.operation = operation
+        self.paginator = capturing_client.client.get_paginator(operation)
+
+    def paginate(self, **kwargs):
+        client = self.capturing_client
+        response_key = RESPONSE_KEYS.get(self.operation)
+        for page in self.paginator.paginate(**kwargs):
+            if response_key:
+                client.writer.append(client.account_id, client.meta.region_name, self.operation, page[response_key])
+            yield page
+
+
+class ReplaySession:
+    """
+    Stands in for the boto3 session returned by assume_role, serving EC2 pages from a capture.
+
+    Args:
+        reader (CaptureReader): Capture to replay.
+        account_id (str): Account whose inventory is replayed.
+    """
+
+    def __init__(self, reader, account_id):
+        self.reader = reader
+        self.account_id = account_id
+
+    def regions(self):
+        return self.reader.regions(self.account_id)
+
+    def client(self, service, region_name=None, **kwargs):
+        if service != 'ec2':
+            raise ValueError(f"Only EC2 can be replayed from a capture, not {service}")
+        return ReplayClient(self, region_name)
+
+
+class ReplayEvents:
+    """
+    Accepts the client factory's event handlers, replayed pages make no API calls to hook into.
+    """
+
+    def register(self, event_name, handler, *args, **kwargs):
+        pass
+
+    def unregister(self, event_name, handler=None, *args, **kwargs):
+        pass
+
+
+class ReplayMeta:
+    def __init__(self, region):
+        self.region_name = region
+        self.events = ReplayEvents()
+
+
+class ReplayClient:
+    def __init__(self, session, region):
+        self.session = session
+        self.meta = ReplayMeta(region)
+
+    def get_paginator(self, operation):
+        if operation not in RESPONSE_KEYS:
+            raise ValueError(f"{operation} is not captured")
+        return ReplayPaginator(self, operation)
+
+
+class ReplayPaginator:
+    def __init__(self, client, operation):
+        self.client = client
+        self.operation = operation
+
+    def paginate(self, PaginationConfig=None, Filters=None, **kwargs):
+        session = self.client.session
+        response_key = RESPONSE_KEYS[self.operation]
+        pages = session.reader.iter_pages(session.account_id, self.client.meta.region_name, self.operation)
+        for records in pages:
+            if Filters:
+                records = _apply_filters(self.operation, records, Filters)
+            yield {response_key: records}
+
+
+def _apply_filters(operation, records, filters):
+    # Captured pages may hold more than a filtered request asked for, e.g. all instances of a region
+    wanted = {FILTER_FIELDS[f['Name']]: {str(value).lower() for value in f['Values']}
+              for f in filters if f['Name'] in FILTER_FIELDS}
+
+    def matches(record):
+        return all(str(record.get(field)).lower() in values for field, values in wanted.items())
+
+    if operation == 'describe_instances':
+        reservations = [{**reservation, 'Instances': [i for i in reservation['Instances'] if matches(i)]}
+                        for reservation in records]
+        return [reservation for reservation in reservations if reservation['Instances']]
+    return [record for record in records if matches(record)]
@@ -0,0 +1,209 @@
+"""
+Region Inventory
+
+This module fetches the EC2 inventory the analyzers evaluate (EBS volumes and
+security group rules) once per region per run, so the number of API calls does
+not grow with the number of enabled checks.
+
+Records are streamed page by page and handed to every interested analyzer as
+they arrive, which keeps peak memory flat regardless of account size. Regions
+are scanned in parallel through a bounded thread pool.
+
+When a resource type has a single consumer, the analyzer's API filters are sent
+with the describe call, so EC2 only returns the records that can become findings.
+
+With a capture writer, every page read through the inventory's clients is also
+recorded for offline replay, see inventory_capture.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from botocore.exceptions import ClientError
+
+from library.aws.instance_enricher import InstanceEnricher
+from library.aws.inventory_capture import CapturingClient
+from library.helpers.aws_clients import get_client
+from library.helpers.logger import log
+from library.helpers.metrics import metrics
+
+DEFAULT_MAX_REGION_CONCURRENCY = 5
+
+# Describe API and response key for each resource type analyzers can consume
+RESOURCE_APIS = {
+    'volumes': ('describe_volumes', 'Volumes'),
+    'security_group_rules': ('describe_security_group_rules', 'SecurityGroupRules'),
+}
+
+# MaxResults range each describe API accepts, page sizes are clamped to it
+PAGE_SIZE_LIMITS = {
+    'describe_volumes': (5, 500),
+    'describe_security_group_rules': (5, 1000),
+}
+
+
+class RegionInventory:
+    """
+    Streams EC2 resources per region and fans each record out to the analyzers.
+    """
+
+    def __init__(self, session, page_size=None, max_workers=None, deadline=None, account_id=None, capture=None):
+        self.session = session
+        self.account_id = account_id  # Clients of the same account share per-region rate limiters
+        self.page_size = page_size  # MaxResults per describe call, clamped per API, None uses the API default
+        self.max_workers = max_workers or DEFAULT_MAX_REGION_CONCURRENCY
+        self.deadline = deadline  # time.monotonic() value after which no more pages are fetched
+        self.timed_out = False
+        self.capture = capture  # CaptureWriter recording every page read, None to not capture
+        self.clients = {}
+        self.api_calls = 0  # Track how many describe calls were made
+        self.lock = threading.Lock()  # boto3 sessions and analyzers are not thread-safe
+        self.instances = InstanceEnricher(self)  # Attached instance details, shared by the EBS checks
+
+    def client(self, region):
+        """
+        Returns the EC2 client for a region, creating it on first use.
+
+        Args:
+            region (str): AWS region name.
+        """
+        with self.lock:
+            if region not in self.clients:
+                client = get_client('ec2', region, session=self.session, scope=self.account_id)
+                if self.capture:
+                    client = CapturingClient(client, self.capture, self.account_id)
+                self.clients[region] = client
+            return self.clients[region]
+
+    def iter_pages(self, resource, region, filters=None):
+        """
+        Yields pages of records of a resource type in a region, one API call at a time.
+
+        Args:
+            resource (str): Resource type, one of RESOURCE_APIS.
+            region (str): AWS region name.
+            filters (List[dict]): Optional EC2 API filters, ignored when capturing.
+
+        Yields:
+            List[dict]: Records as returned by the describe API.
+        """
+        operation, response_key = RESOURCE_APIS[resource]
+        paginator = self.client(region).get_paginator(operation)
+
+        self._check_deadline(operation)
+        for page in paginator.paginate(**self._page_request(operation, filters)):
+            self._count_page()
+            yield page[response_key]
+            # Checked before the next page is requested, the page just read has been evaluated
+            self._check_deadline(operation)
+
+    def _page_request(self, operation, filters):
+        request = {'PaginationConfig': {}}
+        if self.page_size:
+            # One page size is shared by every API, each only accepts its own MaxResults range
+            low, high = PAGE_SIZE_LIMITS[operation]
+            request['PaginationConfig']['PageSize'] = max(low, min(high, self.page_size))
+        # Captures must hold the full inventory, filtered reads are only used when nothing is captured
+        if filters and not self.capture:
+            request['Filters'] = filters
+        return request
+
+    def _check_deadline(self, operation):
+        if self.deadline and time.monotonic() > self.deadline:
+            raise TimeoutError(f"time budget exhausted while reading {operation}")
+
+    def _count_page(self):
+        with self.lock:
+            self.api_calls += 1
+
+    def scan(self, region_list, analyzers):
+        """
+        Sweeps each region once per resource type and passes every record
+        to all analyzers that consume it. Regions run in parallel on up to
+        max_workers threads; errors are isolated per region and recorded on
+        each affected analyzer.
+
+        Args:
+            region_list (List[str]): A list of AWS regions to scan.
+            analyzers (list): Analyzers exposing RESOURCE, API_FILTERS, FINDINGS, evaluate() and errors.
+        """
+        workers = max(1, min(self.max_workers, len(region_list)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # list() waits for every region and surfaces anything not caught per region
+            list(executor.map(lambda region: self._scan_region(region, analyzers), region_list))
+
+        self.sort_findings(region_list, analyzers)
+
+    @staticmethod
+    def sort_findings(region_list, analyzers):
+        """
+        Orders each analyzer's findings by the position of their region in region_list.
+        Regions finish in any order, this keeps reports reproducible.
+        """
+        region_order = {region: index for index, region in enumerate(region_list)}
+        for analyzer in analyzers:
+            getattr(analyzer, analyzer.FINDINGS).sort(key=lambda finding: region_order[finding.region])
+
+    def _scan_region(self, region, analyzers):
+        with metrics.timer('RegionScan', account_id=self.account_id, region=region):
+            for resource, consumers in self._consumers(analyzers):
+                with self._region_errors(region, consumers):
+                    for records in self.iter_pages(resource, region, self._shared_filters(consumers)):
+                        self._evaluate_page(records, region, consumers)
+
+    @staticmethod
+    def _consumers(analyzers):
+        """
+        Yields each resource type with the analyzers consuming it, skipping types nobody consumes.
+        """
+        for resource in RESOURCE_APIS:
+            consumers = [analyzer for analyzer in analyzers if analyzer.RESOURCE == resource]
+            if consumers:
+                yield resource, consumers
+
+    @contextmanager
+    def _region_errors(self, region, consumers):
+        """
+        Records an error raised while sweeping a region on its consumers, so other regions carry on.
+        """
+        try:
+            yield
+        except TimeoutError as e:
+            self.timed_out = True
+            self._record_error(consumers, f"Stopped scanning region {region}: {e}")
+        except ClientError as e:
+            self._record_error(consumers, f"Error scanning region {region}: {e}")
+        except Exception as e:
+            self._record_error(consumers, f"Unexpected error in region {region}: {e}")
+
+    def _evaluate_page(self, records, region, consumers):
+        metrics.add('RecordsScanned', len(records))
+        # Fetching runs in parallel, evaluation is serialized one page at a time
+        with self.lock:
+            for analyzer in consumers:
+                # Analyzers may evaluate a whole page at once, the others get one record at a time
+                evaluate_page = getattr(analyzer, 'evaluate_page', None)
+                if evaluate_page:
+                    evaluate_page(records, region)
+                else:
+                    for record in records:
+                        analyzer.evaluate(record, region)
+
+    @staticmethod
+    def _shared_filters(analyzers):
+        """
+        Returns the API filters to send when every consumer asks for the same ones.
+        Consumers with different filters share one unfiltered sweep instead.
+        """
+        filters = [analyzer.API_FILTERS for analyzer in analyzers]
+        if all(analyzer_filters == filters[0] for analyzer_filters in filters):
+            return filters[0]
+        return None
+
+    def _record_error(self, analyzers, error_msg):
+        log.error(error_msg, account_id=self.account_id)
+        with self.lock:
+            for analyzer in analyzers:
+                analyzer.errors.append(error_msg)
@@ -0,0 +1,62 @@
+"""
+Analyzer Registry
+
+This module maps compliance check names, as used in the event's enabled_checks,
+to analyzer classes. Built-in checks are registered by import path and only
+imported when an event enables them, so a run pays the import cost of the
+checks it uses and nothing else.
+
+New checks are registered by adding a lazy "<module>:<Class>" entry to the
+registry, or by decorating the analyzer class with @register_analyzer("<check>").
+"""
+
+import importlib
+import threading
+
+# Check name -> analyzer class, or "<module>:<Class>" until first use
+_registry = {
+    "ebs_unencrypted": "library.aws.ebs_unencrypted_volumes_analyzer:EbsUnencryptedVolumesAnalyzer",
+    "ebs_gp2": "library.aws.ebs_gp2_analyzer:EbsGP2Analyzer",
+    "security_groups": "library.aws.security_group_analyzer:SecurityGroupAnalyzer",
+}
+_lock = threading.RLock()  # Reentrant, importing a module runs its @register_analyzer under the lock
+
+
+def register_analyzer(name):
+    """
+    Class decorator registering an analyzer under a check name.
+
+    Args:
+        name (str): Check name used in enabled_checks.
+    """
+    def decorator(cls):
+        with _lock:
+            _registry[name] = cls
+        return cls
+    return decorator
+
+
+def registered_checks():
+    """
+    Returns the names of all registered checks, in registration order.
+    """
+    return list(_registry)
+
+
+def get_analyzer(name):
+    """
+    Returns the analyzer class for a check, importing its module if needed.
+
+    Args:
+        name (str): Check name used in enabled_checks.
+
+    Raises:
+        KeyError: If no analyzer is registered under the name.
+    """
+    with _lock:
+        analyzer = _registry[name]
+        if isinstance(analyzer, str):
+            module_name, class_name = analyzer.split(":")
+            analyzer = getattr(importlib.import_module(module_name), class_name)
+            _registry[name] = analyzer
+        return analyzer
@@ -5,23 +5,66 @@ This module checks for security groups in AWS accounts and regions that have ove
 It generates a CSV report and sends it via SES to designated recipients.
 """
 
-import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
+from library.aws.region_inventory import RegionInventory
+from library.aws.registry import register_analyzer
+from library.aws.sg_policy import SecurityGroupPolicy
+from library.helpers.exclusions import ExclusionRules
+from library.helpers.finding_record import FindingRecord
+from library.helpers.logger import log
+from library.helpers.lru_cache import LRUCache
 
+# describe_security_groups accepts up to 200 values per filter
+DESCRIBE_BATCH_SIZE = 200
 
+# Security group details keyed by (account ID, region, group ID), shared across regions and warm invocations
+sg_cache = LRUCache(maxsize=10000, ttl=3600)
+
+
+class SecurityGroupRuleFinding(FindingRecord):
+    """
+    A risky security group rule in the report, one per CIDR or prefix list.
+    """
+
+    COLUMNS = (
+        ('account_id', 'Account ID'),
+        ('region', 'Region'),
+        ('vpc_id', 'VPC ID'),  # Filled in by _enrich_security_groups
+        ('group_id', 'Security Group ID'),
+        ('group_name', 'Security Group Name'),
+        ('group_description', 'Security Group Description'),
+        ('direction', 'Direction'),
+        ('protocol', 'Protocol'),
+        ('port_range', 'Port Range'),
+        ('cidr', 'Source/Destination CIDR'),
+        ('ip_version', 'IP Version'),
+        ('risk', 'Risk'),
+        ('rule_id', 'Rule ID'),
+    )
+    __slots__ = tuple(attribute for attribute, _ in COLUMNS)
+
+
+@register_analyzer("security_groups")
 class SecurityGroupAnalyzer:
     """
-    Analyzes security groups in AWS accounts and regions for presence of default 0.0.0.0/0 rule for all ports and protocols.
+    Analyzes security groups in AWS accounts and regions for presence of default 0.0.0.0/0 rule for all ports and protocols,
+    and for the broader risks defined in the SecurityGroupPolicy.
     Collects data and sends a CSV report via SES.
     """
     
-    def __init__(self, account_id, session, exclusions):
+    RESOURCE = 'security_group_rules'
+    # describe_security_group_rules cannot filter on CIDR, every rule is evaluated client-side
+    API_FILTERS = []
+    FINDING_ID = 'Rule ID'
+    FINDINGS = 'default_sg_rules'
+
+    def __init__(self, account_id, session, exclusions, inventory=None, policy=None):
         self.account_id = account_id
         self.session = session
-        self.excluded_sg_rules = exclusions.get('security_group_rule_ids', [])
+        self.inventory = inventory or RegionInventory(session)
+        self.policy = SecurityGroupPolicy(policy)
+        self.excluded_sg_rules = ExclusionRules(exclusions.get('security_group_rule_ids', []))
         self.default_sg_rules = []
         self.errors = []
-        self.sg_cache = {} # Cache for SG details
         self.excluded_rules_count = 0  # Track how many rules were excluded
     
     def analyze(self, region_list):
@@ -31,44 +74,33 @@ class SecurityGroupAnalyzer:
         Args:
             region_list (List[str]): A list of AWS regions to scan.
         """
-        print("SG: Analyzing for overly permissive rules...")
+        log.info("SG: Analyzing for overly permissive rules...")
         # print(f"SG: Excluding {len(self.excluded_sg_rules)} security group rules from analysis")
         
-        for region in region_list:
-            try:
-                ec2 = self.session.client('ec2', region_name=region)
-                
-                paginator = ec2.get_paginator('describe_security_group_rules')
-                page_iterator = paginator.paginate()
-                
-                for page in page_iterator:
-                    sg_rules = page['SecurityGroupRules']
-                    
-                    for rule in sg_rules:
-                        self._analyze_security_group_rule(rule, region, ec2)
-                        
-            except ClientError as e:
-                error_msg = f"Error scanning region {region}: {e}"
-                print(error_msg)
-                self.errors.append(error_msg)
-            except Exception as e:
-                error_msg = f"Unexpected error in region {region}: {e}"
-                print(error_msg)
-                self.errors.append(error_msg)
-        
-        print(f"SG: Analysis complete. Found {len(self.default_sg_rules)} risky rules across {len(region_list)} regions.")
-        print(f"SG: Excluded {self.excluded_rules_count} rules from the report based on exclusion list.")
-        
-        print(self.default_sg_rules)
-        print(f"""SG Summary:
-            - Total risky security group rules found: {len(self.default_sg_rules)}
-            - Excluded rules from report: {self.excluded_rules_count}
-            - Regions scanned: {len(region_list)})
-        """)
+        self.inventory.scan(region_list, [self])
+        return self.report(region_list)
+
+    def report(self, region_list):
+        """
+        Summarizes the findings and builds the report for the email module.
+
+        Args:
+            region_list (List[str]): The AWS regions that were scanned.
+        """
+        self._enrich_security_groups()
+
+        log.info(
+            f"SG: Analysis complete. Found {len(self.default_sg_rules)} risky rules across {len(region_list)} regions.",
+            check="security_groups",
+            account_id=self.account_id,
+            regions_scanned=len(region_list),
+            excluded=self.excluded_rules_count,
+            excluded_by_rule=dict(self.excluded_sg_rules.counts.most_common())
+        )
+        log.findings("security_groups", self.default_sg_rules)
 
         if not self.default_sg_rules:
-            print("SG: No security group with unrestricted rules found.")
-            return          
+            return
         return {
             "csv_data": self.default_sg_rules,
             "filename": f"security-group-analysis-{self.account_id}.csv",
@@ -88,23 +120,49 @@ class SecurityGroupAnalyzer:
             """
         }
     
-    def _analyze_security_group_rule(self, rule, region, ec2_client):
+    def evaluate_page(self, rules, region):
         """
-        Analyze a single security group rule for risky open access.
-        
+        Analyze a page of security group rules as one batch. The policy and
+        exclusion predicates run over the whole page first, and report rows are
+        only built for the rules that match.
+
         Args:
-            rule (dict): Security group rule data from AWS API
+            rules (List[dict]): A describe_security_group_rules page streamed from the region inventory
             region (str): AWS region name
-            ec2_client: EC2 client for additional API calls if needed
         """
-        rule_id = rule.get('SecurityGroupRuleId')
-        
+        risky_rules = [(rule, reason) for rule, reason in zip(rules, map(self.policy.evaluate, rules)) if reason]
+
         # Skip if rule is in exclusion list
-        if rule_id in self.excluded_sg_rules:
-            self.excluded_rules_count += 1
-            # print(f"SG: Skipping excluded rule {rule_id}")
-            return
+        if risky_rules and len(self.excluded_sg_rules):
+            excluded = [
+                self.excluded_sg_rules.is_excluded(rule.get('SecurityGroupRuleId'), rule.get('Tags'))
+                for rule, _ in risky_rules
+            ]
+            self.excluded_rules_count += sum(excluded)
+            risky_rules = [risky_rule for risky_rule, is_excluded in zip(risky_rules, excluded) if not is_excluded]
+
+        for rule, reason in risky_rules:
+            self._record_risky_rule(rule, region, reason)
+
+    def evaluate(self, rule, region):
+        """
+        Analyze a single security group rule for risky open access.
         
+        Args:
+            rule (dict): Security group rule data streamed from the region inventory
+            region (str): AWS region name
+        """
+        self.evaluate_page([rule], region)
+
+    def _record_risky_rule(self, rule, region, reason):
+        """
+        Add a risky rule to the report data.
+
+        Args:
+            rule (dict): Security group rule data
+            region (str): AWS region name
+            reason (str): Why the policy flagged the rule
+        """
         sg_id = rule.get('GroupId')
         direction = 'Ingress' if rule.get('IsEgress') == False else 'Egress'
         protocol = rule.get('IpProtocol')
@@ -125,65 +183,54 @@ class SecurityGroupAnalyzer:
             port_range = f"{from_port}-{to_port}"
             protocol_name = protocol.upper()
 
-        for cidr, ip_version in [(rule.get('CidrIpv4'), 'IPv4'), (rule.get('CidrIpv6'), 'IPv6')]:
-            if cidr in ['0.0.0.0/0', '::/0']:
-                # self._record_rule_with_open_access(rule, sg_id, region, direction, protocol_name, port_range, cidr, ip_version)
-                
-                ### If not using _record_rule_with_open_access as a separte method, you can directly append to the list with below 
-                self.default_sg_rules.append({
-                    'Account ID': self.account_id,
-                    'Region': region,
-                    'Security Group ID': sg_id,
-                    'Direction': direction,
-                    'Protocol': protocol_name,
-                    'Port Range': port_range,
-                    'Source/Destination CIDR': cidr,
-                    'IP Version': ip_version,
-                    'Rule ID': rule.get('SecurityGroupRuleId', '')
-                })
+        for cidr, ip_version in [(rule.get('CidrIpv4'), 'IPv4'), (rule.get('CidrIpv6'), 'IPv6'), (rule.get('PrefixListId'), 'Prefix List')]:
+            if cidr:
+                self.default_sg_rules.append(SecurityGroupRuleFinding(
+                    account_id=self.account_id,
+                    region=region,
+                    group_id=sg_id,
+                    direction=direction,
+                    protocol=protocol_name,
+                    port_range=port_range,
+                    cidr=cidr,
+                    ip_version=ip_version,
+                    risk=reason,
+                    rule_id=rule.get('SecurityGroupRuleId', '')
+                ))
     
-    # def _record_rule_with_open_access(self, rule, sg_id, region, direction, protocol_name, port_range, cidr, ip_version):
-    #     """
-    #     Add a risky rule to the report data.
-        
-    #     Args:
-    #         rule (dict): Security group rule data
-    #         sg_id (str): Security group ID
-    #         region (str): AWS region
-    #         direction (str): 'Ingress' or 'Egress'
-    #         protocol_name (str): Protocol name
-    #         port_range (str): Port range
-    #         cidr (str): CIDR block
-    #         ip_version (str): 'IPv4' or 'IPv6'
-    #     """
-        
-    #     # Get SG details from cache or API
-    #     if sg_id not in self.sg_cache:
-    #         try:
-    #             ec2 = boto3.client('ec2', region_name=region)
-    #             sg_details = ec2.describe_security_groups(GroupIds=[sg_id])['SecurityGroups'][0]
-    #             self.sg_cache[sg_id] = {
-    #                 'name': sg_details.get('GroupName', ''),
-    #                 'vpc_id': sg_details.get('VpcId', 'EC2-Classic')
-    #             }
-    #         except Exception as e:
-    #             print(f"SG: Warning - Could not get security group details for {sg_id}: {e}")
-    #             self.sg_cache[sg_id] = {'name': '', 'vpc_id': 'Unknown'}
-
-    #     sg_name = self.sg_cache[sg_id]['name']
-    #     vpc_id = self.sg_cache[sg_id]['vpc_id']
-        
-    #     self.default_sg_rules.append({
-    #         'Account ID': self.account_id,
-    #         'Region': region,
-    #         'VPC ID': vpc_id,
-    #         'Security Group ID': sg_id,
-    #         'Security Group Name': sg_name,
-    #         'Direction': direction,
-    #         'Protocol': protocol_name,
-    #         'Port Range': port_range,
-    #         'Source/Destination CIDR': cidr,
-    #         'IP Version': ip_version,
-    #         'Description': rule.get('Description', ''),
-    #         'Rule ID': rule.get('SecurityGroupRuleId', '')
-    #     })
+    def _enrich_security_groups(self):
+        """
+        Adds VPC ID, group name and description to the findings. Distinct group IDs
+        are resolved per region in batched describe_security_groups calls, and
+        results are cached so repeated groups and warm invocations cost nothing.
+        """
+        missing = {}
+        for finding in self.default_sg_rules:
+            key = (self.account_id, finding.region, finding.group_id)
+            if sg_cache.get(key) is None:
+                missing.setdefault(finding.region, set()).add(finding.group_id)
+
+        for region, group_ids in missing.items():
+            try:
+                self._describe_security_groups(region, sorted(group_ids))
+            except Exception as e:
+                log.warning(f"SG: Could not get security group details in {region}: {e}", account_id=self.account_id)
+
+        for finding in self.default_sg_rules:
+            details = sg_cache.get((self.account_id, finding.region, finding.group_id), {})
+            finding.vpc_id = details.get('vpc_id', '')
+            finding.group_name = details.get('name', '')
+            finding.group_description = details.get('description', '')
+
+    def _describe_security_groups(self, region, group_ids):
+        ec2 = self.inventory.client(region)
+        paginator = ec2.get_paginator('describe_security_groups')
+        for start in range(0, len(group_ids), DESCRIBE_BATCH_SIZE):
+            batch = group_ids[start:start + DESCRIBE_BATCH_SIZE]
+            for page in paginator.paginate(Filters=[{'Name': 'group-id', 'Values': batch}]):
+                for group in page['SecurityGroups']:
+                    sg_cache.put((self.account_id, region, group['GroupId']), {
+                        'name': group.get('GroupName', ''),
+                        'vpc_id': group.get('VpcId', 'EC2-Classic'),
+                        'description': group.get('Description', '')
+                    })
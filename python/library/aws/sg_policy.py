@@ -0,0 +1,148 @@
+"""
+Security Group Risk Policy
+
+This module decides whether a security group rule is risky. On top of rules open
+to the whole internet (0.0.0.0/0, ::/0), it flags ingress from broad public
+ranges, sensitive ports reachable from large public blocks, and prefix-list
+references reaching sensitive ports.
+
+The policy is compiled once into sorted tables (merged port intervals and
+private address ranges), so each rule is checked with a couple of binary
+searches instead of string comparisons.
+"""
+
+import bisect
+import ipaddress
+
+OPEN_CIDRS = {'0.0.0.0/0', '::/0'}
+
+DEFAULT_POLICY = {
+    # Ingress from a public range this wide or wider is flagged on any port
+    "max_ipv4_prefix_length": 8,
+    "max_ipv6_prefix_length": 16,
+    # Ingress to a sensitive port from a public range this wide or wider is flagged
+    "sensitive_max_ipv4_prefix_length": 16,
+    "sensitive_max_ipv6_prefix_length": 48,
+    # Inclusive [from, to] port ranges
+    "sensitive_ports": [
+        [22, 22],        # SSH
+        [23, 23],        # Telnet
+        [445, 445],      # SMB
+        [1433, 1433],    # SQL Server
+        [3306, 3306],    # MySQL
+        [3389, 3389],    # RDP
+        [5432, 5432],    # PostgreSQL
+        [6379, 6379],    # Redis
+        [9200, 9300],    # Elasticsearch
+        [27017, 27017],  # MongoDB
+    ],
+    # Prefix lists can hold any range, so references reaching sensitive ports are flagged for review
+    "flag_prefix_lists": True,
+}
+
+PRIVATE_NETWORKS = [
+    '10.0.0.0/8', '100.64.0.0/10', '127.0.0.0/8', '169.254.0.0/16', '172.16.0.0/12', '192.168.0.0/16',
+    'fc00::/7', 'fe80::/10', '::1/128',
+]
+
+
+class SecurityGroupPolicy:
+    """
+    Compiled risk policy for security group rules.
+    """
+
+    def __init__(self, policy=None):
+        policy = {**DEFAULT_POLICY, **(policy or {})}
+        self.max_prefix_length = {4: policy["max_ipv4_prefix_length"], 6: policy["max_ipv6_prefix_length"]}
+        self.sensitive_max_prefix_length = {
+            4: policy["sensitive_max_ipv4_prefix_length"],
+            6: policy["sensitive_max_ipv6_prefix_length"],
+        }
+        self.flag_prefix_lists = policy["flag_prefix_lists"]
+        self.port_starts, self.port_ends = self._merge_intervals(policy["sensitive_ports"])
+
+        # Private ranges per IP version, as sorted, non-overlapping integer intervals
+        self.private_ranges = {}
+        networks = [ipaddress.ip_network(cidr) for cidr in PRIVATE_NETWORKS]
+        for version in (4, 6):
+            intervals = [[int(net.network_address), int(net.broadcast_address)] for net in networks if net.version == version]
+            self.private_ranges[version] = self._merge_intervals(intervals)
+
+        self.cidr_cache = {}  # CIDR string -> (ip version, prefix length, is public)
+
+    @staticmethod
+    def _merge_intervals(intervals):
+        starts, ends = [], []
+        for start, end in sorted(intervals):
+            if ends and start <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        return starts, ends
+
+    @staticmethod
+    def _overlaps(starts, ends, low, high):
+        # Intervals are merged, so only the last one starting at or below high can overlap
+        index = bisect.bisect_right(starts, high) - 1
+        return index >= 0 and ends[index] >= low
+
+    @staticmethod
+    def _contains(starts, ends, low, high):
+        index = bisect.bisect_right(starts, low) - 1
+        return index >= 0 and ends[index] >= high
+
+    def _parse_cidr(self, cidr):
+        if cidr not in self.cidr_cache:
+            network = ipaddress.ip_network(cidr, strict=False)
+            starts, ends = self.private_ranges[network.version]
+            is_public = not self._contains(starts, ends, int(network.network_address), int(network.broadcast_address))
+            self.cidr_cache[cidr] = (network.version, network.prefixlen, is_public)
+        return self.cidr_cache[cidr]
+
+    def touches_sensitive_port(self, rule):
+        """
+        Checks whether a rule's port range includes any sensitive port.
+
+        Args:
+            rule (dict): Security group rule data from AWS API
+        """
+        protocol = rule.get('IpProtocol')
+        if protocol == '-1':
+            low, high = 0, 65535
+        elif protocol in ('tcp', 'udp', '6', '17'):
+            low, high = rule.get('FromPort'), rule.get('ToPort')
+        else:
+            return False  # ICMP and other protocols have no ports
+        return self._overlaps(self.port_starts, self.port_ends, low, high)
+
+    def evaluate(self, rule):
+        """
+        Returns why a rule is risky, or None when it complies with the policy.
+
+        Args:
+            rule (dict): Security group rule data from AWS API
+        """
+        cidr = rule.get('CidrIpv4') or rule.get('CidrIpv6')
+
+        # Unchanged from the original check, open rules are flagged in both directions
+        if cidr in OPEN_CIDRS:
+            return 'Open to the internet'
+
+        if rule.get('IsEgress'):
+            return None
+
+        if cidr:
+            version, prefix_length, is_public = self._parse_cidr(cidr)
+            if not is_public:
+                return None
+            if prefix_length <= self.max_prefix_length[version]:
+                return 'Broad public CIDR'
+            if prefix_length <= self.sensitive_max_prefix_length[version] and self.touches_sensitive_port(rule):
+                return 'Sensitive port open to public CIDR'
+            return None
+
+        if rule.get('PrefixListId') and self.flag_prefix_lists and self.touches_sensitive_port(rule):
+            return 'Sensitive port open to prefix list'
+
+        return None
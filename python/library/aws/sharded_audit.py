@@ -0,0 +1,389 @@
+"""
+Sharded Audit
+
+This module splits a run into (account, region, check) work units, so accounts
+too large to audit within one Lambda invocation are spread over many:
+
+    coordinate()  plans the units, saves the run's manifest and queues them
+    work()        processes queued units and saves one partial result each
+    reduce()      merges the partial results per account and check and sends the reports
+
+The worker that saves a run's last partial result reduces it. It holds a claim
+in the result store while it works, so the reports are sent once, and saves
+the outcome when they are. A claim older than REDUCE_LEASE_SECONDS is taken over,
+so a reducer that times out or crashes does not block the run: the redelivered
+last unit reduces it again. When a report cannot be sent the run is left unreduced
+and the last unit fails, so it is redelivered once the claim has expired and the
+reports are sent again. A run whose units did not all report can be reduced
+by hand with force, which also overrides a claim. The accounts missing units are
+then reported as incomplete and no reports are sent for them.
+
+Queue and storage come from shard_storage: SQS and S3 in Lambda, in-process
+stand-ins otherwise, see run_local().
+"""
+
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from library.aws.inventory_capture import CaptureReader, ReplaySession, get_capture_writer
+from library.aws.region_inventory import RegionInventory
+from library.aws.registry import registered_checks, get_analyzer
+from library.helpers.assume_role import assume_role
+from library.helpers.finding_record import as_row
+from library.helpers.findings_state import get_state_backend, delta_report, save_state_after_send
+from library.helpers.logger import log
+from library.helpers.lru_cache import LRUCache
+from library.helpers.metrics import metrics
+from library.helpers.report_aggregator import ReportAggregator
+from library.helpers.shard_storage import (
+    InMemoryResultStore, InProcessWorkQueue, get_result_store, get_work_queue
+)
+
+# Seconds a worker must have left to start another unit, the rest go back on the queue
+MIN_UNIT_SECONDS = 60
+# Units a worker in pull mode takes from the queue at a time
+RECEIVE_BATCH_SIZE = 10
+# Seconds after which a reducer's claim is considered dead, kept below the queue's visibility timeout
+REDUCE_LEASE_SECONDS = int(os.environ.get('REDUCE_LEASE_SECONDS', 900))
+
+# Run manifests read by workers, a warm worker reads each run's manifest once
+manifest_cache = LRUCache(maxsize=16)
+
+
+def unit_id(account_id, region, check):
+    return f"{account_id}/{region}/{check}"
+
+
+def plan_units(run_id, account_events):
+    """
+    Splits accounts into one work unit per region and enabled check.
+
+    Args:
+        run_id (str): ID of the sharded run.
+        account_events (List[dict]): Account settings, as audited by audit_account.
+
+    Returns:
+        List[dict]: Work units, one per distinct unit ID. They refer to their account by its
+            index in the run's manifest, so a unit stays small however long its exclusions are.
+    """
+    known_checks = registered_checks()
+    units = {}
+    for index, account in enumerate(account_events):
+        for region in account.get("regions", []):
+            for check in account.get("enabled_checks", []):
+                unit = unit_id(account.get("account_id"), region, check)
+                # Partial results are keyed by unit ID, a repeated region, check or account would never report
+                if check in known_checks and unit not in units:
+                    units[unit] = {'run_id': run_id, 'unit_id': unit, 'account': index, 'region': region, 'check': check}
+    units = list(units.values())
+    for unit in units:
+        unit['units_total'] = len(units)  # Lets workers tell when the run is complete without reading the manifest
+    return units
+
+
+def coordinate(account_events, digest=None, run_id=None, queue=None, store=None):
+    """
+    Starts a sharded run: saves its manifest and queues one unit per account, region and check.
+
+    Args:
+        account_events (List[dict]): Account settings, with the event's defaults applied.
+        digest (str): "batch" to send one email for every account, as in an unsharded run.
+        run_id (str): ID for the run, generated when None.
+        queue (WorkQueue): Queue for the units, get_work_queue() when None.
+        store (ResultStore): Storage for the run, get_result_store() when None.
+
+    Returns:
+        dict: The run ID and how many units were queued.
+    """
+    queue = queue or get_work_queue()
+    store = store or get_result_store()
+    run_id = run_id or f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    units = plan_units(run_id, account_events)
+
+    # Saved before queueing, so no worker can finish the run before the reducer can read it
+    store.save_manifest(run_id, {
+        'run_id': run_id,
+        'digest': digest,
+        'accounts': account_events,
+        'units': [unit['unit_id'] for unit in units],
+    })
+    queue.send(units)
+    log.info(f"Sharded run {run_id}: queued {len(units)} work units for {len(account_events)} account(s)",
+             run_id=run_id, units=len(units))
+
+    result = {'run_id': run_id, 'units': len(units)}
+    if not units:
+        result['reduced'] = reduce(run_id, store=store)
+    return result
+
+
+def work(deadline=None, queue=None, store=None, max_units=None):
+    """
+    Processes units from the queue until it is empty or the deadline is near.
+
+    Args:
+        deadline (float): time.monotonic() value by which the worker must stop.
+        queue (WorkQueue): Queue to take units from, get_work_queue() when None.
+        store (ResultStore): Storage for the results, get_result_store() when None.
+        max_units (int): Units to process at most, None for no limit.
+
+    Returns:
+        dict: Units processed, requeued and failed, and the outcome of any run this worker reduced.
+    """
+    queue = queue or get_work_queue()
+    store = store or get_result_store()
+    summary = {'processed': 0, 'requeued': 0, 'failed': 0, 'reduced': []}
+
+    while max_units is None or summary['processed'] < max_units:
+        batch_size = RECEIVE_BATCH_SIZE if max_units is None else min(RECEIVE_BATCH_SIZE, max_units - summary['processed'])
+        received = queue.receive(batch_size)
+        if not received:
+            break
+        for index, (receipt, unit) in enumerate(received):
+            try:
+                outcome = process_unit(unit, deadline, store)
+            except Exception as e:
+                # Left on the queue, it is redelivered after the visibility timeout, once a reducer's claim has expired
+                log.error(f"Work unit {unit['unit_id']}: failed: {e}", run_id=unit['run_id'])
+                summary['failed'] += 1
+                continue
+            if outcome is None:
+                # Out of time, this unit and the rest of the batch go back for another worker
+                unfinished = received[index:]
+                for unfinished_receipt, unfinished_unit in unfinished:
+                    queue.release(unfinished_receipt, unfinished_unit)
+                summary['requeued'] += len(unfinished)
+                return summary
+            summary['processed'] += 1
+            if outcome is not True:
+                summary['reduced'].append(outcome)
+            queue.delete(receipt)
+    return summary
+
+
+def process_records(records, deadline=None, store=None):
+    """
+    Processes units delivered by the SQS event source mapping.
+
+    Returns:
+        dict: batchItemFailures listing the messages SQS should deliver again.
+    """
+    store = store or get_result_store()
+    failures = []
+    for record in records:
+        unit = json.loads(record['body'])
+        try:
+            outcome = process_unit(unit, deadline, store)
+        except Exception as e:
+            log.error(f"Work unit {unit['unit_id']}: failed: {e}", run_id=unit['run_id'])
+            outcome = None
+        if outcome is None:
+            failures.append({'itemIdentifier': record['messageId']})
+    return {'batchItemFailures': failures}
+
+
+def process_unit(unit, deadline=None, store=None):
+    """
+    Runs one check over one region of one account and saves the partial result.
+    The run is reduced when this was its last unit.
+
+    Args:
+        unit (dict): Work unit planned by plan_units.
+        deadline (float): time.monotonic() value by which scanning must stop.
+        store (ResultStore): Storage for the result, get_result_store() when None.
+
+    Returns:
+        None when the unit ran out of time and must be retried, the reduce outcome
+        when it completed the run, True otherwise.
+    """
+    store = store or get_result_store()
+    if deadline and time.monotonic() > deadline - MIN_UNIT_SECONDS:
+        return None
+
+    account = _load_manifest(unit['run_id'], store)['accounts'][unit['account']]
+    with metrics.timer('WorkUnit', account_id=account.get("account_id"), region=unit['region'], check=unit['check']):
+        result = _run_unit(unit, account, deadline)
+    if result is None:
+        log.warning(f"Work unit {unit['unit_id']}: time budget exhausted, unit will be retried", run_id=unit['run_id'])
+        return None
+
+    store.save_partial(unit['run_id'], unit['unit_id'], result)
+    if store.count_partials(unit['run_id']) >= unit['units_total']:
+        return reduce(unit['run_id'], store=store)
+    return True
+
+
+def _load_manifest(run_id, store):
+    manifest = manifest_cache.get(run_id)
+    if manifest is None:
+        manifest = store.load_manifest(run_id)
+        if manifest is None:
+            raise ValueError(f"Unknown sharded run: {run_id}")
+        manifest_cache.put(run_id, manifest)
+    return manifest
+
+
+def _run_unit(unit, account, deadline):
+    account_id = account.get("account_id")
+    region = unit['region']
+    check = unit['check']
+    result = {'unit_id': unit['unit_id'], 'status': 'completed', 'errors': [], 'report': None}
+
+    try:
+        if account.get("replay_path"):
+            session = ReplaySession(CaptureReader(account["replay_path"]), account_id)
+        else:
+            with metrics.timer('AssumeRole', account_id=account_id):
+                session = assume_role(account_id)
+        capture = get_capture_writer(account["capture_path"]) if account.get("capture_path") else None
+
+        inventory = RegionInventory(
+            session,
+            account_id=account_id,
+            page_size=account.get("page_size"),
+            deadline=deadline,
+            capture=capture
+        )
+        options = account.get("check_options", {}).get(check, {})
+        analyzer = get_analyzer(check)(account_id, session, account.get("exclusions", {}), inventory, **options)
+        inventory.scan([region], [analyzer])
+    except Exception as e:
+        # Saved as a failed result, so the run still completes and reports the account as failed
+        log.error(f"Work unit {unit['unit_id']}: failed: {e}", account_id=account_id)
+        return {**result, 'status': 'failed', 'errors': [str(e)]}
+
+    if inventory.timed_out:
+        return None
+
+    report = analyzer.report([region])
+    if report:
+        # Rows are keyed by CSV header, as the findings state stores them
+        report = {**report, 'csv_data': [as_row(finding) for finding in report['csv_data']]}
+    return {**result, 'errors': analyzer.errors, 'report': report}
+
+
+def reduce(run_id, store=None, force=False):
+    """
+    Merges a run's partial results into one report per account and check and sends them.
+
+    Args:
+        run_id (str): ID of the sharded run.
+        store (ResultStore): Storage of the run, get_result_store() when None.
+        force (bool): Reduce even though units are missing or another reducer holds the claim.
+
+    Returns:
+        dict: Status of the run, and the outcome per account once reduced.
+
+    Raises:
+        RuntimeError: When some reports could not be sent. The run is then left unreduced,
+            retrying it sends every account's reports again.
+    """
+    store = store or get_result_store()
+    manifest = store.load_manifest(run_id)
+    if manifest is None:
+        raise ValueError(f"Unknown sharded run: {run_id}")
+    if store.load_reduced(run_id) is not None:
+        return {'run_id': run_id, 'status': 'already_reduced'}
+
+    partials = store.load_partials(run_id)
+    missing = [unit for unit in manifest['units'] if unit not in partials]
+    if missing and not force:
+        return {'run_id': run_id, 'status': 'pending', 'missing_units': len(missing)}
+    if not store.claim_reduce(run_id, REDUCE_LEASE_SECONDS, force=force):
+        return {'run_id': run_id, 'status': 'reducing'}
+
+    batch_aggregator = None
+    if manifest.get('digest') == "batch":
+        batch_aggregator = ReportAggregator(report_dir=manifest['accounts'][0].get("report_dir"))
+    results = [
+        _reduce_account(account, partials, batch_aggregator)
+        for account in manifest['accounts']
+    ]
+    if batch_aggregator:
+        batch_aggregator.send()
+    unsent = [result['account_id'] for result in results if result['status'] == 'unsent']
+    if unsent:
+        raise RuntimeError(f"Sharded run {run_id}: reports not sent for accounts {unsent}")
+
+    outcome = {'run_id': run_id, 'status': 'completed', 'accounts': results}
+    # Saved only once the reports are sent, until then a dead reducer's claim can be taken over
+    store.complete_reduce(run_id, outcome)
+    log.info(f"Sharded run {run_id}: reduced {len(partials)} work units", run_id=run_id, missing_units=len(missing))
+    return outcome
+
+
+def _reduce_account(account, partials, aggregator=None):
+    account_id = account.get("account_id")
+    # Repeated regions and checks share one unit, merge each once
+    regions = list(dict.fromkeys(account.get("regions", [])))
+    known_checks = registered_checks()
+    enabled_checks = [check for check in dict.fromkeys(account.get("enabled_checks", [])) if check in known_checks]
+    errors = [f"Unknown compliance check: {check}" for check in account.get("enabled_checks", [])
+              if check not in known_checks]
+
+    units = {(region, check): partials.get(unit_id(account_id, region, check))
+             for region in regions for check in enabled_checks}
+    missing = [unit_id(account_id, region, check) for (region, check), result in units.items() if result is None]
+    errors += [f"Work unit {unit} did not report" for unit in missing]
+    errors += [error for result in units.values() if result for error in result['errors']]
+    if missing:
+        # Partial findings would under-report, as for accounts that run out of time
+        log.warning(f"Account {account_id}: {len(missing)} work units missing, reports not sent", account_id=account_id)
+        return {'account_id': account_id, 'status': 'incomplete', 'errors': errors}
+    if any(result['status'] == 'failed' for result in units.values()):
+        return {'account_id': account_id, 'status': 'failed', 'errors': errors}
+
+    state_backend = get_state_backend() if account.get("delta_only") else None
+    account_aggregator = aggregator or ReportAggregator(report_dir=account.get("report_dir"))
+    findings = {}
+    for check in enabled_checks:
+        # Regions are merged in the requested order, as an unsharded scan sorts them
+        reports = [units[(region, check)]['report'] for region in regions]
+        rows = [row for report in reports if report for row in report['csv_data']]
+        template = next((report for report in reports if report), None)
+        report = {**template, 'csv_data': rows} if template else None
+        findings[check] = len(rows)
+        if state_backend:
+            complete = not any(units[(region, check)]['errors'] for region in regions)
+            report, state = delta_report(state_backend, account_id, check, get_analyzer(check).FINDING_ID, report,
+                                         complete=complete)
+            save_state_after_send(account_aggregator, state_backend, account_id, check, state)
+        account_aggregator.add(account_id, report)
+
+    if aggregator is None:
+        try:
+            account_aggregator.send()
+        except Exception as e:
+            log.error(f"Account {account_id}: reports not sent: {e}", account_id=account_id)
+            return {'account_id': account_id, 'status': 'unsent', 'findings': findings, 'errors': errors + [str(e)]}
+
+    return {'account_id': account_id, 'status': 'completed', 'findings': findings, 'errors': errors}
+
+
+def run_local(account_events, digest=None, workers=4, deadline=None):
+    """
+    Runs a sharded audit in this process, with an in-process queue and in-memory storage.
+    Useful to exercise the coordinator, workers and reducer without SQS or S3.
+
+    Args:
+        account_events (List[dict]): Account settings, with the event's defaults applied.
+        digest (str): "batch" to send one email for every account.
+        workers (int): Worker threads draining the queue.
+        deadline (float): time.monotonic() value by which the workers must stop.
+
+    Returns:
+        dict: The reduce outcome of the run.
+    """
+    queue = InProcessWorkQueue()
+    store = InMemoryResultStore()
+    run = coordinate(account_events, digest, queue=queue, store=store)
+    if 'reduced' in run:
+        return run['reduced']
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        summaries = list(executor.map(lambda _: work(deadline, queue=queue, store=store), range(workers)))
+    reduced = [outcome for summary in summaries for outcome in summary['reduced']]
+    return reduced[0] if reduced else reduce(run['run_id'], store=store, force=True)
@@ -1,15 +1,30 @@
 """
 This module provides a function to assume an IAM role in a specified AWS account.
-It returns a new boto3 session with temporary credentials for the assumed role.
+It returns a boto3 session backed by refreshable temporary credentials for the assumed role.
+
+Sessions are cached at module level per account and role, so warm Lambda invocations
+reuse them without another STS round trip, and credentials renew shortly before they expire.
 """
 
+import threading
 import boto3
+from botocore.credentials import RefreshableCredentials
 from botocore.exceptions import ClientError
+from botocore.session import get_session
+from library.helpers.aws_clients import get_client
+from library.helpers.logger import log
+
+# Guards the per-account locks, accounts audited in parallel share this lock
+_client_lock = threading.Lock()
+
+# Sessions keyed by (account_id, role_name), kept for the lifetime of the Lambda container
+_session_cache = {}
+_session_locks = {}
 
 
 def assume_role(account_id, role_name="CloudreachAWSComplianceRole", session_name="CloudreachAWSComplianceRoleSession"):
     """
-    Assumes a role in the target account and returns a new boto3 session.
+    Assumes a role in the target account and returns a cached boto3 session.
 
     Args:
         account_id (str): AWS Account ID of the target account.
@@ -17,27 +32,53 @@ def assume_role(account_id, role_name="CloudreachAWSComplianceRole", session_nam
         session_name (str): Session name for the STS assume role call.
 
     Returns:
-        boto3.Session: A new session object for the assumed role.
+        boto3.Session: A session whose credentials refresh automatically before expiry.
     """
-    sts_client = boto3.client("sts")
+    key = (account_id, role_name)
+
+    with _client_lock:
+        session_lock = _session_locks.setdefault(key, threading.Lock())
 
+    # Per-account lock, so different accounts can assume roles in parallel
+    with session_lock:
+        if key not in _session_cache:
+            _session_cache[key] = _create_session(account_id, role_name, session_name)
+        return _session_cache[key]
+
+
+def _create_session(account_id, role_name, session_name):
+    """
+    Builds a boto3 session whose credentials are fetched, and later renewed, through STS.
+    """
     role_arn = f"arn:aws:iam::{account_id}:role/{role_name}"
 
-    try:
-        response = sts_client.assume_role(
-            RoleArn=role_arn,
-            RoleSessionName=session_name
-        )
+    def fetch_credentials():
+        try:
+            response = get_client("sts").assume_role(
+                RoleArn=role_arn,
+                RoleSessionName=session_name
+            )
+        except ClientError as e:
+            log.error(f"Failed to assume role {role_arn}: {e}", account_id=account_id)
+            raise
 
         credentials = response["Credentials"]
+        return {
+            "access_key": credentials["AccessKeyId"],
+            "secret_key": credentials["SecretAccessKey"],
+            "token": credentials["SessionToken"],
+            "expiry_time": credentials["Expiration"].isoformat()
+        }
 
-        # Return a session using temporary credentials
-        return boto3.Session(
-            aws_access_key_id=credentials["AccessKeyId"],
-            aws_secret_access_key=credentials["SecretAccessKey"],
-            aws_session_token=credentials["SessionToken"]
-        )
+    # botocore refreshes these credentials when they are close to expiry, before each API call
+    credentials = RefreshableCredentials.create_from_metadata(
+        metadata=fetch_credentials(),
+        refresh_using=fetch_credentials,
+        method="sts-assume-role"
+    )
 
-    except ClientError as e:
-        print(f"Failed to assume role {role_arn}: {e}")
-        raise
+    botocore_session = get_session()
+    botocore_session._credentials = credentials
+    session = boto3.Session(botocore_session=botocore_session)
+    session.role_arn = role_arn  # Identifies the credentials in the client pool
+    return session
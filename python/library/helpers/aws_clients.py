@@ -0,0 +1,257 @@
+"""
+This module creates the boto3 clients used by the audits (EC2, STS, SES and S3).
+Every client retries with botocore's adaptive mode, and its calls go through a
+token-bucket rate limiter shared by all workers calling the same service in the
+same account and region, so parallel scans run close to the API limit without
+tipping over into RequestLimitExceeded.
+
+Throttled responses are counted per service, region and operation, so a run can
+report how often it was pushed back, and every call is timed for the run's metrics.
+
+Clients are kept in a process-wide pool keyed by credentials identity, service
+and region. Creating a client loads its service model, so reusing them across
+analyzers and warm invocations saves that cost and keeps HTTP connections open.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+import boto3
+from botocore.config import Config
+
+from library.helpers.lru_cache import LRUCache
+from library.helpers.metrics import metrics
+
+# Attempts per call, including the first one, before a throttling error is raised
+RETRY_MAX_ATTEMPTS = int(os.environ.get('AWS_RETRY_MAX_ATTEMPTS', 10))
+
+# Least recently used clients are dropped once the pool is full
+CLIENT_POOL_MAX_SIZE = int(os.environ.get('CLIENT_POOL_MAX_SIZE', 128))
+# HTTP connections per client, region scans share one client per region
+MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', 10))
+
+# Service -> (requests per second, burst), EC2 matches its default describe call bucket, S3 is not limited
+DEFAULT_RATE_LIMITS = {
+    'ec2': (20, 100),
+    'sts': (50, 100),
+    'ses': (5, 10),
+}
+# e.g. API_RATE_LIMITS='{"ec2": [10, 50]}'
+RATE_LIMITS = {**DEFAULT_RATE_LIMITS, **{
+    service: tuple(limit) for service, limit in json.loads(os.environ.get('API_RATE_LIMITS') or '{}').items()
+}}
+
+THROTTLING_ERROR_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException',
+    'RequestLimitExceeded', 'TooManyRequestsException', 'RequestThrottled', 'SlowDown',
+}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket, callers block until a token is available.
+
+    Args:
+        rate (float): Tokens added per second.
+        capacity (int): Maximum number of tokens, i.e. the allowed burst.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes one token, possibly borrowed from the future, without waiting.
+
+        Returns:
+            float: Seconds the caller must wait before making its call.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            # A negative balance queues callers behind each other, one refill interval apart
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self):
+        """
+        Takes one token, waiting for the bucket to refill if it is empty.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class ThrottleMetrics:
+    """
+    Counts throttled responses and time spent waiting on the rate limiters.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Clears all counters, called at the start of each invocation.
+        """
+        with self.lock:
+            self.throttles = Counter()  # (service, region, operation) -> throttled responses
+            self.wait_seconds = Counter()  # (service, region) -> seconds blocked on the limiter
+
+    def record_throttle(self, service, region, operation):
+        with self.lock:
+            self.throttles[(service, region, operation)] += 1
+
+    def record_wait(self, service, region, seconds):
+        with self.lock:
+            self.wait_seconds[(service, region)] += seconds
+
+    def summary(self):
+        """
+        Returns the counters as a JSON serialisable dict.
+        """
+        with self.lock:
+            return {
+                'throttled_calls': sum(self.throttles.values()),
+                'throttles': [
+                    {'service': service, 'region': region, 'operation': operation, 'count': count}
+                    for (service, region, operation), count in self.throttles.most_common()
+                ],
+                'rate_limiter_wait_seconds': round(sum(self.wait_seconds.values()), 3),
+            }
+
+
+throttle_metrics = ThrottleMetrics()
+
+# (scope, service, region) -> TokenBucket, shared by every client of that account, service and region
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(service, region, scope=None):
+    """
+    Returns the shared token bucket for a service and region, or None when the service is not limited.
+
+    Args:
+        service (str): AWS service name, e.g. 'ec2'.
+        region (str): AWS region name.
+        scope (str): Account the calls are made in, limits apply per account.
+    """
+    if service not in RATE_LIMITS:
+        return None
+    key = (scope, service, region)
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            _rate_limiters[key] = TokenBucket(*RATE_LIMITS[service])
+        return _rate_limiters[key]
+
+
+def create_client(service, region_name=None, session=None, scope=None):
+    """
+    Creates a client with adaptive retries, rate limiting and throttle metrics.
+
+    Args:
+        service (str): AWS service name, e.g. 'ec2'.
+        region_name (str): AWS region name, None uses the session's default region.
+        session (boto3.Session): Session to create the client from, None uses the Lambda's own credentials.
+        scope (str): Account the calls are made in, clients of the same scope share a rate limiter.
+    """
+    config = Config(
+        retries={'max_attempts': RETRY_MAX_ATTEMPTS, 'mode': 'adaptive'},
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True
+    )
+    if session is None:
+        client = boto3.client(service, region_name=region_name, config=config)
+    else:
+        client = session.client(service, region_name=region_name, config=config)
+
+    region = client.meta.region_name
+    limiter = get_rate_limiter(service, region, scope)
+    if limiter is not None:
+        def before_call(**kwargs):
+            waited = limiter.acquire()
+            if waited:
+                throttle_metrics.record_wait(service, region, waited)
+        client.meta.events.register('before-call', before_call)
+
+    instrument_client(client, service)
+    return client
+
+
+def instrument_client(client, service):
+    """
+    Registers the throttle counting and call metrics hooks on a client's events.
+    Also used for aiobotocore clients, whose emitter calls the same hooks.
+
+    Args:
+        client: boto3 or aiobotocore client.
+        service (str): AWS service name, e.g. 'ec2'.
+    """
+    region = client.meta.region_name
+
+    def needs_retry(response=None, operation=None, **kwargs):
+        # Called after every attempt, returning None leaves the retry decision to botocore
+        if response is not None:
+            error_code = response[1].get('Error', {}).get('Code')
+            if error_code in THROTTLING_ERROR_CODES:
+                throttle_metrics.record_throttle(service, region, operation.name)
+    client.meta.events.register('needs-retry', needs_retry)
+
+    # Registered after the rate limiter, so time spent waiting for a token is not counted as call duration
+    def start_timer(context=None, **kwargs):
+        context['metrics_start'] = time.monotonic()
+
+    def record_call(http_response=None, parsed=None, model=None, context=None, **kwargs):
+        duration_ms = (time.monotonic() - context.get('metrics_start', time.monotonic())) * 1000
+        size = int(http_response.headers.get('content-length') or 0)
+        retries = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        metrics.record_api_call(service, model.name, duration_ms, size, retries)
+    client.meta.events.register('before-call', start_timer)
+    client.meta.events.register('after-call', record_call)
+
+
+# (credentials identity, service, region) -> client, kept for the lifetime of the Lambda container
+client_pool = LRUCache(maxsize=CLIENT_POOL_MAX_SIZE)
+_client_pool_lock = threading.Lock()  # Creating clients from a shared session is not thread-safe
+
+
+def get_client(service, region_name=None, session=None, scope=None):
+    """
+    Returns a pooled client, creating it with create_client on first use.
+
+    Args:
+        service (str): AWS service name, e.g. 'ec2'.
+        region_name (str): AWS region name, None uses the session's default region.
+        session (boto3.Session): Session to create the client from, None uses the Lambda's own credentials.
+        scope (str): Account the calls are made in, clients of the same scope share a rate limiter.
+    """
+    key = (_credentials_identity(session), service, region_name)
+    client = client_pool.get(key)
+    if client is None:
+        with _client_pool_lock:
+            client = client_pool.get(key)
+            if client is None:
+                client = create_client(service, region_name, session=session, scope=scope)
+                client_pool.put(key, client)
+    return client
+
+
+def _credentials_identity(session):
+    if session is None:
+        return 'lambda'
+    # Sessions from assume_role carry their role ARN, their credentials refresh in place
+    return getattr(session, 'role_arn', None) or session
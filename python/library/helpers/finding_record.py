@@ -0,0 +1,54 @@
+"""
+This module provides the base class for the findings analyzers collect.
+
+Each check defines one record class listing its report columns once, as
+(attribute, CSV header) pairs, and the attributes become __slots__. Records hold
+no per-instance dict and no repeated header keys, which keeps large multi-region
+runs small in memory. Headers are only attached when a report is rendered or
+its findings are saved for delta audits.
+"""
+
+
+class FindingRecord:
+    """
+    Compact, slotted finding. Subclasses set COLUMNS and __slots__ to the same attributes, e.g.
+
+        COLUMNS = (('volume_id', 'Volume ID'), ('region', 'Region'))
+        __slots__ = tuple(attribute for attribute, _ in COLUMNS)
+    """
+
+    __slots__ = ()
+    COLUMNS = ()
+
+    def __init__(self, **values):
+        for attribute in self.__slots__:
+            setattr(self, attribute, values.get(attribute, ''))
+
+    @classmethod
+    def headers(cls):
+        """
+        Returns the CSV headers, in column order.
+        """
+        return [header for _, header in cls.COLUMNS]
+
+    def values(self):
+        """
+        Returns the column values, in the same order as headers().
+        """
+        return [getattr(self, attribute) for attribute in self.__slots__]
+
+    def as_row(self):
+        """
+        Returns the finding as a dict keyed by CSV header.
+        """
+        return dict(zip(self.headers(), self.values()))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.as_row()})"
+
+
+def as_row(finding):
+    """
+    Returns a finding as a dict keyed by CSV header, whether it is a record or already a row.
+    """
+    return finding.as_row() if isinstance(finding, FindingRecord) else finding
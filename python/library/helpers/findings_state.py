@@ -0,0 +1,173 @@
+"""
+This module persists the findings of each run per account and check, so the next
+run can report only what changed: new findings, resolved findings and the count
+of unchanged ones.
+
+The storage backend is pluggable. A JSON file per account and check is used by
+default, and S3 is used when FINDINGS_STATE_BUCKET is set, so state survives
+Lambda cold starts. Other stores (e.g. DynamoDB) only need load() and save().
+"""
+
+import os
+import json
+from botocore.exceptions import ClientError
+from library.helpers.aws_clients import get_client
+from library.helpers.finding_record import as_row
+from library.helpers.logger import log
+
+FINDINGS_STATE_DIR = os.environ.get('FINDINGS_STATE_DIR', '/tmp/findings-state')
+FINDINGS_STATE_BUCKET = os.environ.get('FINDINGS_STATE_BUCKET')
+FINDINGS_STATE_PREFIX = os.environ.get('FINDINGS_STATE_PREFIX', 'findings-state/')
+
+
+class FindingsStateBackend:
+    """
+    Interface for findings state storage. Findings are stored as a dict of
+    resource ID to report row.
+    """
+
+    def load(self, account_id, check):
+        """
+        Returns the findings saved by the previous run, or an empty dict.
+        """
+        raise NotImplementedError
+
+    def save(self, account_id, check, findings):
+        """
+        Replaces the saved findings for an account and check.
+        """
+        raise NotImplementedError
+
+
+class JsonFileStateBackend(FindingsStateBackend):
+    """
+    Stores findings as one JSON file per account and check in a local directory.
+    """
+
+    def __init__(self, directory=FINDINGS_STATE_DIR):
+        self.directory = directory
+
+    def _path(self, account_id, check):
+        return os.path.join(self.directory, f"{account_id}-{check}.json")
+
+    def load(self, account_id, check):
+        try:
+            with open(self._path(account_id, check), encoding="utf-8") as state_file:
+                return json.load(state_file)
+        except FileNotFoundError:
+            return {}
+
+    def save(self, account_id, check, findings):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(account_id, check)
+        # Write then rename, so an interrupted run never leaves a truncated state file
+        with open(f"{path}.tmp", "w", encoding="utf-8") as state_file:
+            json.dump(findings, state_file)
+        os.replace(f"{path}.tmp", path)
+
+
+class S3StateBackend(FindingsStateBackend):
+    """
+    Stores findings as one JSON object per account and check in S3.
+    """
+
+    def __init__(self, bucket=FINDINGS_STATE_BUCKET, prefix=FINDINGS_STATE_PREFIX, s3_client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.s3_client = s3_client or get_client('s3')
+
+    def _key(self, account_id, check):
+        return f"{self.prefix}{account_id}/{check}.json"
+
+    def load(self, account_id, check):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self._key(account_id, check))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                return {}
+            raise
+        return json.loads(response['Body'].read())
+
+    def save(self, account_id, check, findings):
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self._key(account_id, check),
+            Body=json.dumps(findings).encode("utf-8")
+        )
+
+
+def get_state_backend():
+    """
+    Returns the S3 backend when FINDINGS_STATE_BUCKET is set, the local JSON backend otherwise.
+    """
+    if FINDINGS_STATE_BUCKET:
+        return S3StateBackend()
+    return JsonFileStateBackend()
+
+
+def compute_delta(previous, current):
+    """
+    Compares two sets of findings keyed by resource ID.
+
+    Args:
+        previous (dict): Findings saved by the last run.
+        current (dict): Findings of this run.
+
+    Returns:
+        tuple: (new rows, resolved rows, number of unchanged findings)
+    """
+    new = [row for resource_id, row in current.items() if resource_id not in previous]
+    resolved = [row for resource_id, row in previous.items() if resource_id not in current]
+    unchanged = len(current) - len(new)
+    return new, resolved, unchanged
+
+
+def delta_report(backend, account_id, check, finding_id, module_output, complete=True):
+    """
+    Turns an analyzer output into a report of changes since the last run.
+    The new state is returned rather than saved, so callers save it only once the report is delivered.
+
+    Args:
+        backend (FindingsStateBackend): Where findings are persisted.
+        account_id (str): AWS Account ID.
+        check (str): Name of the compliance check.
+        finding_id (str): Report column holding the resource ID.
+        module_output (dict): Output from the analyzer, None when nothing was found.
+        complete (bool): False when some regions failed, findings missing from this run
+            are then not reported as resolved and the saved state is left untouched.
+
+    Returns:
+        tuple: (report with a Change column or None when nothing changed,
+            findings to save once it is sent or None when the state must be left untouched)
+    """
+    # State is saved keyed by CSV header, so it stays readable and independent of the record classes
+    rows = [as_row(finding) for finding in module_output["csv_data"]] if module_output else []
+    current = {row[finding_id]: row for row in rows}
+    previous = backend.load(account_id, check)
+
+    new, resolved, unchanged = compute_delta(previous, current)
+    state = current
+    if not complete:
+        resolved = []
+        state = None
+
+    log.info(f"Delta {check}: {len(new)} new, {len(resolved)} resolved, {unchanged} unchanged", account_id=account_id)
+
+    if not new and not resolved:
+        return None, state
+
+    return {
+        "csv_data": [{'Change': 'New', **row} for row in new] + [{'Change': 'Resolved', **row} for row in resolved],
+        "filename": f"{check}-changes-{account_id}.csv",
+        "subject": f"Compliance changes for {check} in AWS Account - {account_id}",
+        "body_text": ""
+    }, state
+
+
+def save_state_after_send(aggregator, backend, account_id, check, state):
+    """
+    Saves a delta report's findings state once the aggregator has sent the report,
+    so a failed send reports the same changes again on the next run.
+    """
+    if state is not None:
+        aggregator.after_send(lambda: backend.save(account_id, check, state))
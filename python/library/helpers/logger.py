@@ -0,0 +1,142 @@
+"""
+This module provides the structured logger used by the analyzers and the region
+inventory. Log events are written as one JSON object per line and buffered, so
+a run with thousands of findings makes a handful of writes instead of one per
+message.
+
+Findings are never dumped in full by default. Each report logs its finding
+count and a small sample, and messages repeated per resource (e.g. skipped
+exclusions) are capped per run, with the number suppressed reported at the end.
+Full dumps, split into events well under the CloudWatch Logs size limit, are
+only written when the event sets "debug": true.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from library.helpers.finding_record import as_row
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# Findings included with each report's summary when not in debug mode
+FINDINGS_SAMPLE_SIZE = int(os.environ.get('LOG_FINDINGS_SAMPLE_SIZE', 5))
+# Times a repeated message is logged per run before it is only counted
+SAMPLED_MESSAGE_LIMIT = int(os.environ.get('LOG_SAMPLED_MESSAGE_LIMIT', 20))
+# Buffered events written at once, errors are written straight away
+BUFFER_SIZE = int(os.environ.get('LOG_BUFFER_SIZE', 50))
+# Findings per event in debug dumps, keeps events far below the 256 KB limit
+DUMP_CHUNK_SIZE = 100
+
+
+class StructuredLogger:
+    """
+    Level-aware, buffered JSON logger, configured once per invocation.
+
+    Args:
+        stream: File-like object to write to, stdout by default.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream  # None resolves sys.stdout on each write, so redirection applies
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.configure()
+
+    def configure(self, level=None, debug=False):
+        """
+        Sets the level for a run and clears the sampling counters.
+
+        Args:
+            level (str): Minimum level logged, LOG_LEVEL when None.
+            debug (bool): Log at DEBUG and dump findings in full.
+        """
+        with self.lock:
+            self.debug_mode = bool(debug)
+            self.level = LEVELS['DEBUG'] if debug else LEVELS.get((level or LOG_LEVEL).upper(), LEVELS['INFO'])
+            self.sampled_counts = Counter()
+
+    def is_enabled(self, level):
+        return LEVELS[level] >= self.level
+
+    def log(self, level, message, **fields):
+        """
+        Buffers one log event, dropped when below the configured level.
+        """
+        if not self.is_enabled(level):
+            return
+        event = json.dumps({'timestamp': round(time.time(), 3), 'level': level, 'message': message, **fields}, default=str)
+        with self.lock:
+            self.buffer.append(event)
+            should_flush = len(self.buffer) >= BUFFER_SIZE or LEVELS[level] >= LEVELS['ERROR']
+        if should_flush:
+            self.flush()
+
+    def debug(self, message, **fields):
+        self.log('DEBUG', message, **fields)
+
+    def info(self, message, **fields):
+        self.log('INFO', message, **fields)
+
+    def warning(self, message, **fields):
+        self.log('WARNING', message, **fields)
+
+    def error(self, message, **fields):
+        self.log('ERROR', message, **fields)
+
+    def sampled(self, key, level, message, **fields):
+        """
+        Logs a message repeated per resource at most SAMPLED_MESSAGE_LIMIT times per run.
+
+        Args:
+            key (str): Identifies the repeated message, e.g. 'ebs_gp2.excluded'.
+        """
+        with self.lock:
+            self.sampled_counts[key] += 1
+            count = self.sampled_counts[key]
+        if count <= SAMPLED_MESSAGE_LIMIT or self.debug_mode:
+            self.log(level, message, **fields)
+
+    def findings(self, check, findings):
+        """
+        Logs a sample of a check's findings, or all of them in debug mode.
+
+        Args:
+            check (str): Name of the compliance check.
+            findings (List[FindingRecord]): The check's findings.
+        """
+        self.info(f"{check}: {len(findings)} findings", check=check, count=len(findings),
+                  sample=[as_row(finding) for finding in findings[:FINDINGS_SAMPLE_SIZE]])
+        if not self.debug_mode:
+            return
+        for start in range(0, len(findings), DUMP_CHUNK_SIZE):
+            self.debug(f"{check}: findings {start + 1}-{min(start + DUMP_CHUNK_SIZE, len(findings))}", check=check,
+                       findings=[as_row(finding) for finding in findings[start:start + DUMP_CHUNK_SIZE]])
+
+    def flush(self):
+        """
+        Writes the buffered events.
+        """
+        with self.lock:
+            events, self.buffer = self.buffer, []
+        if events:
+            stream = self.stream or sys.stdout
+            stream.write("\n".join(events) + "\n")
+            stream.flush()
+
+    def close_run(self):
+        """
+        Reports suppressed messages and flushes, called at the end of each invocation.
+        """
+        with self.lock:
+            suppressed = {key: count - SAMPLED_MESSAGE_LIMIT for key, count in self.sampled_counts.items()
+                          if count > SAMPLED_MESSAGE_LIMIT}
+        if suppressed and not self.debug_mode:
+            self.info("Repeated messages suppressed", suppressed=suppressed)
+        self.flush()
+
+
+log = StructuredLogger()
@@ -0,0 +1,45 @@
+"""
+This module provides a small thread-safe LRU cache with an optional time to live.
+Instances kept at module level survive across warm Lambda invocations.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Bounded mapping that evicts the least recently used entry when full.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl  # Seconds an entry stays valid, None to keep it until evicted
+        self.entries = OrderedDict()  # key -> (stored at, value)
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for key and marks it as recently used.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or (self.ttl is not None and time.monotonic() - entry[0] > self.ttl):
+                self.entries.pop(key, None)
+                return default
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        """
+        Stores a value, evicting the least recently used entry if the cache is full.
+        """
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
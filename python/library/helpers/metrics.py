@@ -0,0 +1,156 @@
+"""
+This module records how long each stage of a run takes (role assumption, region
+scans, reports, CSV rendering, email) and every AWS API call made through the
+client factory: call counts, durations, response bytes and retries.
+
+At the end of an invocation the totals are emitted as one JSON document in
+CloudWatch Embedded Metric Format, which CloudWatch turns into metrics when it is
+written to the Lambda log. Per-stage and per-operation breakdowns are included as
+plain properties of the same document, so they can be queried in Logs Insights.
+Set METRICS_SINK=none to disable the output, e.g. when running locally.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'AWSComplianceNotifier')
+METRICS_SINK = os.environ.get('METRICS_SINK', 'emf')
+# Stage timings kept per invocation, further ones are only added to the totals
+MAX_STAGE_DETAILS = 1000
+
+
+class EmfSink:
+    """
+    Writes metric documents to a stream, stdout by default, where Lambda picks them up as log events.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream  # None resolves sys.stdout on each write, so redirection applies
+
+    def emit(self, document):
+        stream = self.stream or sys.stdout
+        stream.write(json.dumps(document, default=str) + "\n")
+        stream.flush()
+
+
+class NullSink:
+    """
+    Discards metric documents.
+    """
+
+    def emit(self, document):
+        pass
+
+
+class Metrics:
+    """
+    Thread-safe collector of stage timings and API call metrics for one invocation.
+
+    Args:
+        sink: Object with an emit(document) method, chosen from METRICS_SINK when None.
+    """
+
+    def __init__(self, sink=None):
+        self.sink = sink or (NullSink() if METRICS_SINK == 'none' else EmfSink())
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Clears everything recorded so far, called at the start of each invocation.
+        """
+        with self.lock:
+            self.values = defaultdict(float)  # Metric name -> value
+            self.units = {}  # Metric name -> CloudWatch unit
+            self.stages = []  # Individual stage timings with their properties
+            self.api_calls = defaultdict(lambda: defaultdict(float))  # "service.Operation" -> totals
+
+    def add(self, name, value, unit='Count'):
+        """
+        Adds a value to a metric, metrics are summed over the invocation.
+        """
+        with self.lock:
+            self.values[name] += value
+            self.units[name] = unit
+
+    @contextmanager
+    def timer(self, stage, **properties):
+        """
+        Times a block of code, recording <stage>Duration and <stage>Count.
+        The block is timed even when it raises.
+
+        Args:
+            stage (str): Stage name, e.g. 'RegionScan'.
+            **properties: Details stored with this timing, e.g. account and region.
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            duration_ms = (time.monotonic() - start) * 1000
+            self.add(f"{stage}Duration", duration_ms, 'Milliseconds')
+            self.add(f"{stage}Count", 1)
+            with self.lock:
+                if len(self.stages) < MAX_STAGE_DETAILS:
+                    self.stages.append({'stage': stage, 'duration_ms': round(duration_ms, 1), **properties})
+
+    def record_api_call(self, service, operation, duration_ms, size, retries):
+        """
+        Records one API call, called by the client factory after every call.
+
+        Args:
+            service (str): AWS service name, e.g. 'ec2'.
+            operation (str): API operation name, e.g. 'DescribeVolumes'.
+            duration_ms (float): Time from the call to the parsed response, retries included.
+            size (int): Response body size in bytes.
+            retries (int): Attempts made after the first one.
+        """
+        prefix = service.capitalize()
+        self.add(f"{prefix}Calls", 1)
+        self.add(f"{prefix}CallDuration", duration_ms, 'Milliseconds')
+        self.add(f"{prefix}ResponseBytes", size, 'Bytes')
+        self.add(f"{prefix}Retries", retries)
+        with self.lock:
+            totals = self.api_calls[f"{service}.{operation}"]
+            totals['calls'] += 1
+            totals['duration_ms'] += duration_ms
+            totals['bytes'] += size
+            totals['retries'] += retries
+
+    def document(self):
+        """
+        Returns the invocation's metrics as a CloudWatch Embedded Metric Format document.
+        """
+        with self.lock:
+            metric_values = {name: round(value, 3) for name, value in self.values.items()}
+            return {
+                '_aws': {
+                    'Timestamp': int(time.time() * 1000),
+                    'CloudWatchMetrics': [{
+                        'Namespace': METRICS_NAMESPACE,
+                        'Dimensions': [['FunctionName']],
+                        'Metrics': [{'Name': name, 'Unit': self.units[name]} for name in sorted(metric_values)],
+                    }],
+                },
+                'FunctionName': os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local'),
+                **metric_values,
+                'stages': list(self.stages),
+                'api_calls': {
+                    operation: {key: round(value, 3) for key, value in totals.items()}
+                    for operation, totals in sorted(self.api_calls.items())
+                },
+            }
+
+    def flush(self):
+        """
+        Emits the invocation's metrics to the sink.
+        """
+        self.sink.emit(self.document())
+
+
+metrics = Metrics()
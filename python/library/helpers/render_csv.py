@@ -0,0 +1,44 @@
+"""
+This module provides a function to render CSV data for email attachments.
+Reports are written to an in-memory buffer, so nothing touches /tmp and
+concurrent runs cannot collide on file names.
+"""
+
+import csv
+import io
+from library.helpers.finding_record import FindingRecord
+from library.helpers.logger import log
+
+
+def render_csv(module_output):
+    """
+    Renders the module output as CSV into an in-memory buffer.
+    Args:
+        module_output (dict): Output from the module containing CSV data and metadata.
+
+    Returns:
+        tuple: (filename, data) ready to attach, or None when there is nothing to render.
+    """
+    if not module_output:
+        log.info("No data to render.")
+        return None
+
+    rows = module_output["csv_data"]
+    filename = module_output["filename"]
+
+    buffer = io.BytesIO()
+    # write_through encodes each row straight into the buffer instead of holding a text copy
+    csvfile = io.TextIOWrapper(buffer, encoding="utf-8", newline="", write_through=True)
+    if isinstance(rows[0], FindingRecord):
+        # Records only carry values, the check's headers are written once here
+        writer = csv.writer(csvfile)
+        writer.writerow(rows[0].headers())
+        writer.writerows(row.values() for row in rows)
+    else:
+        writer = csv.DictWriter(csvfile, fieldnames=rows[0].keys())
+        writer.writeheader()
+        writer.writerows(rows)
+    csvfile.detach()  # Leave the buffer open once the text wrapper goes away
+
+    # A view over the buffer avoids copying the rendered bytes before they are attached
+    return filename, buffer.getbuffer()
@@ -0,0 +1,145 @@
+"""
+This module provides a report aggregator that collects analyzer outputs
+and sends them as a single digest email with one CSV attachment per report.
+Oversized reports are compressed or replaced by S3 links, see report_output.
+With a report directory the CSVs are written there instead of emailed, e.g. when
+replaying a capture offline.
+"""
+
+import os
+import json
+import threading
+from library.helpers.render_csv import render_csv
+from library.helpers.report_output import ReportOutput
+from library.helpers.logger import log
+from library.helpers.metrics import metrics
+from library.helpers.send_email import send_email
+
+sender = os.environ.get('EMAIL_FROM')
+recipients = json.loads(os.environ.get('EMAIL_TO', '[]'))
+
+
+class ReportAggregator:
+    """
+    Collects analyzer outputs for one account, or a batch of accounts,
+    and emails them together in one SES call.
+
+    Args:
+        output (ReportOutput): Handles oversized attachments.
+        ses_client: SES client to send with, the shared client when None.
+        report_dir (str): Directory to write the CSVs to instead of emailing them.
+    """
+
+    def __init__(self, output=None, ses_client=None, report_dir=None):
+        self.output = output or ReportOutput()
+        self.ses_client = ses_client
+        self.report_dir = report_dir
+        self.reports = []
+        self.after_send_callbacks = []  # Run once the reports are delivered, e.g. saving the findings state
+        self.lock = threading.Lock()  # Accounts in a batch add reports from parallel workers
+
+    def add(self, account_id, module_output):
+        """
+        Adds an analyzer output to the digest. Empty outputs are ignored.
+
+        Args:
+            account_id (str): AWS Account ID the report belongs to.
+            module_output (dict): Output from the analyzer containing CSV data and metadata.
+        """
+        if not module_output:
+            return
+        with self.lock:
+            self.reports.append((account_id, module_output))
+
+    def after_send(self, callback):
+        """
+        Registers a callable to run once send() has delivered the reports, or found none to send.
+        It is not run when sending fails.
+        """
+        with self.lock:
+            self.after_send_callbacks.append(callback)
+
+    def send(self):
+        """
+        Renders every collected report to CSV and sends one email with all of them attached.
+
+        Raises:
+            Exception: When the email could not be sent, the after_send callbacks are then not run.
+        """
+        self._deliver()
+        for callback in self.after_send_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                # The reports are already delivered, a failed callback must not fail the accounts sent with them
+                log.error(f"Failed to run after sending reports: {e}")
+
+    def _deliver(self):
+        if not self.reports:
+            log.info("No data to email.")
+            return
+
+        # Parallel accounts finish in any order, group the attachments by account for a stable email
+        self.reports.sort(key=lambda report: report[0])
+        account_ids = sorted({account_id for account_id, _ in self.reports})
+        with metrics.timer('RenderCsv', reports=len(self.reports)):
+            attachments = [render_csv(module_output) for _, module_output in self.reports]
+        metrics.add('CsvBytes', sum(len(data) for _, data in attachments), 'Bytes')
+        if self.report_dir:
+            self._write_reports(attachments)
+            return
+        attachments, links = self.output.prepare(attachments)
+
+        send_email(
+            sender=sender,
+            recipients=recipients,
+            subject=self._subject(account_ids),
+            body_text=self._body_text(account_ids, links),
+            attachments=attachments,
+            ses_client=self.ses_client
+        )
+
+    def _write_reports(self, attachments):
+        os.makedirs(self.report_dir, exist_ok=True)
+        for filename, data in attachments:
+            with open(os.path.join(self.report_dir, filename), 'wb') as report_file:
+                report_file.write(data)
+        log.info(f"Wrote {len(attachments)} report(s) to {self.report_dir}", report_dir=self.report_dir)
+
+    def _subject(self, account_ids):
+        if len(account_ids) == 1:
+            return f"AWS Compliance Report for AWS Account - {account_ids[0]}"
+        return f"AWS Compliance Report for {len(account_ids)} AWS Accounts"
+
+    def _body_text(self, account_ids, links):
+        findings = "\n".join(
+            f"            - {module_output['subject']}: {len(module_output['csv_data'])} finding(s), see {module_output['filename']}"
+            for _, module_output in self.reports
+        )
+        if links:
+            expiry = _describe_duration(self.output.link_expiry)
+            findings += (f"\n\n            Some reports were too large to attach and can be downloaded here,"
+                         f" the links are valid for up to {expiry}:\n\n")
+            findings += "\n".join(f"            - {filename}: {url}" for filename, url in links)
+        return f"""
+            Hi there,
+
+            As part of our continuous compliance checks, we have reviewed the AWS account(s) {', '.join(account_ids)}.
+
+            The following checks found resources that need attention:
+
+{findings}
+
+            Please refer to the attached reports for details. If any of the findings are expected, let us know so we can update the exclusion list accordingly.
+
+            Regards and thanks,
+            Atos Managed Services
+            """
+
+
+def _describe_duration(seconds):
+    if seconds % 3600 == 0:
+        hours = seconds // 3600
+        return f"{hours} hour{'s' if hours != 1 else ''}"
+    minutes = max(1, seconds // 60)
+    return f"{minutes} minute{'s' if minutes != 1 else ''}"
@@ -0,0 +1,90 @@
+"""
+This module prepares rendered reports for email delivery.
+Attachments above a size threshold are gzip-compressed, and when the email would
+still exceed the SES message size limit the largest reports are uploaded to S3
+and replaced by presigned download links.
+"""
+
+import os
+import gzip
+import uuid
+from datetime import datetime, timezone
+from library.helpers.aws_clients import get_client
+from library.helpers.logger import log
+
+# SES rejects raw messages over 10 MB, attachments grow by a third when base64-encoded
+COMPRESS_THRESHOLD_BYTES = int(os.environ.get('REPORT_COMPRESS_THRESHOLD_BYTES', 1024 * 1024))
+OFFLOAD_THRESHOLD_BYTES = int(os.environ.get('REPORT_OFFLOAD_THRESHOLD_BYTES', 7 * 1024 * 1024))
+REPORT_BUCKET = os.environ.get('REPORT_BUCKET')
+REPORT_PREFIX = os.environ.get('REPORT_PREFIX', 'compliance-reports/')
+# Links signed with the Lambda role's temporary credentials stop working when those credentials
+# expire, which is within hours, so a longer expiry would promise links that no longer work
+LINK_EXPIRY_SECONDS = int(os.environ.get('REPORT_LINK_EXPIRY_SECONDS', 3600))
+
+
+class ReportOutput:
+    """
+    Compresses and, when needed, offloads report attachments before they are emailed.
+    """
+
+    def __init__(self, s3_client=None, bucket=REPORT_BUCKET, compress_threshold=COMPRESS_THRESHOLD_BYTES,
+                 offload_threshold=OFFLOAD_THRESHOLD_BYTES, link_expiry=LINK_EXPIRY_SECONDS):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.compress_threshold = compress_threshold
+        self.offload_threshold = offload_threshold
+        self.link_expiry = link_expiry
+
+    def prepare(self, attachments):
+        """
+        Compresses large attachments and offloads the biggest ones to S3
+        until the remaining attachments fit in the email.
+
+        Args:
+            attachments (list): (filename, data) tuples as rendered for the email.
+
+        Returns:
+            tuple: (attachments, links) where links are (filename, presigned URL) tuples.
+        """
+        attachments = [self._compress(filename, data) for filename, data in attachments]
+
+        links = []
+        total_size = sum(len(data) for _, data in attachments)
+        if total_size <= self.offload_threshold:
+            return attachments, links
+
+        if not self.bucket:
+            log.warning(f"Reports total {total_size} bytes but no REPORT_BUCKET is set, sending them attached")
+            return attachments, links
+
+        # Offload the largest reports first, so as few as possible leave the email
+        for filename, data in sorted(attachments, key=lambda attachment: len(attachment[1]), reverse=True):
+            if total_size <= self.offload_threshold:
+                break
+            links.append((filename, self._upload(filename, data)))
+            total_size -= len(data)
+
+        offloaded = {filename for filename, _ in links}
+        attachments = [attachment for attachment in attachments if attachment[0] not in offloaded]
+        return attachments, links
+
+    def _compress(self, filename, data):
+        if len(data) <= self.compress_threshold:
+            return filename, data
+        compressed = gzip.compress(data)
+        log.info(f"Compressed {filename} from {len(data)} to {len(compressed)} bytes")
+        return f"{filename}.gz", compressed
+
+    def _upload(self, filename, data):
+        if self.s3_client is None:
+            self.s3_client = get_client('s3')
+
+        key = f"{REPORT_PREFIX}{datetime.now(timezone.utc):%Y/%m/%d}/{uuid.uuid4().hex}/{filename}"
+        self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=bytes(data))
+        log.info(f"Uploaded {filename} ({len(data)} bytes) to s3://{self.bucket}/{key}")
+
+        return self.s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': key},
+            ExpiresIn=self.link_expiry
+        )
@@ -1,20 +1,28 @@
 """
 This module provides a function to send emails using AWS SES.
-It allows sending an email with a subject, body text, and an attachment.
+It allows sending an email with a subject, body text, and one or more attachments.
 """
 
-import os
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
-import boto3
+from library.helpers.aws_clients import get_client
+from library.helpers.logger import log
+from library.helpers.metrics import metrics
 
-def send_email(sender, recipients, subject, body_text, attachment_path):
+def send_email(sender, recipients, subject, body_text, attachments, ses_client=None):
     """
     Sends an email with the specified subject and body text,
-    and attaches a file from the given attachment path.
+    and attaches the given in-memory files.
+
+    Args:
+        attachments (list): (filename, data) tuples, data being bytes or a buffer view.
+        ses_client: SES client to send with, a default one is created when None.
+
+    Raises:
+        Exception: Whatever SES raised, so callers do not treat an unsent report as delivered.
     """
-    ses = boto3.client('ses')
+    ses = ses_client or get_client('ses')
 
     if isinstance(recipients, str):
         recipients = [recipients]
@@ -27,19 +35,22 @@ def send_email(sender, recipients, subject, body_text, attachment_path):
     body = MIMEText(body_text, 'plain')
     msg.attach(body)
 
-    with open(attachment_path, 'rb') as file:
-        part = MIMEApplication(file.read())
-        part.add_header('Content-Disposition', 'attachment', 
-                        filename=os.path.basename(attachment_path))
+    for filename, data in attachments:
+        part = MIMEApplication(data)
+        part.add_header('Content-Disposition', 'attachment', filename=filename)
         msg.attach(part)
 
     try:
-        print("Sending email...")
-        response = ses.send_raw_email(
-          Source=sender,
-          Destinations=recipients,
-          RawMessage={'Data': msg.as_string()}
-        )
-        print("Email sent! Message ID:", response['MessageId'])
+        log.info("Sending email...")
+        raw_message = msg.as_string()
+        metrics.add('EmailBytes', len(raw_message), 'Bytes')
+        with metrics.timer('SendEmail'):
+            response = ses.send_raw_email(
+              Source=sender,
+              Destinations=recipients,
+              RawMessage={'Data': raw_message}
+            )
+        log.info(f"Email sent! Message ID: {response['MessageId']}", message_id=response['MessageId'])
     except Exception as e:
-        print("Failed to send email:", e)
+        log.error(f"Failed to send email: {e}")
+        raise
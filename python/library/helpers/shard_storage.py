@@ -0,0 +1,326 @@
+"""
+This module provides the work queue and result storage used by sharded audits,
+where a coordinator splits a run into work units, workers process them and
+write partial results, and a reducer merges those into reports.
+
+Both are pluggable. SQS and S3 are used when WORK_QUEUE_URL and
+SHARD_RESULTS_BUCKET are set. Otherwise in-process stand-ins are used, so a
+sharded run can be exercised locally in a single process.
+"""
+
+import os
+import json
+import queue
+import threading
+import time
+from botocore.exceptions import ClientError
+from library.helpers.aws_clients import get_client
+
+WORK_QUEUE_URL = os.environ.get('WORK_QUEUE_URL')
+SHARD_RESULTS_BUCKET = os.environ.get('SHARD_RESULTS_BUCKET')
+SHARD_RESULTS_PREFIX = os.environ.get('SHARD_RESULTS_PREFIX', 'shard-results/')
+# SQS accepts up to 10 messages per batch call
+SQS_BATCH_SIZE = 10
+# S3 error codes of a conditional write that lost the race
+CONDITIONAL_WRITE_CONFLICTS = ('PreconditionFailed', 'ConditionalRequestConflict')
+
+
+class WorkQueue:
+    """
+    Interface for the queue work units are distributed through. Units are JSON-serializable dicts.
+    """
+
+    def send(self, units):
+        """
+        Puts work units on the queue.
+        """
+        raise NotImplementedError
+
+    def receive(self, max_units=1):
+        """
+        Returns up to max_units (receipt, unit) tuples, an empty list when the queue is empty.
+        """
+        raise NotImplementedError
+
+    def delete(self, receipt):
+        """
+        Removes a received unit once its result is saved.
+        """
+        raise NotImplementedError
+
+    def release(self, receipt, unit):
+        """
+        Hands a received unit back to the queue for another worker.
+        """
+        raise NotImplementedError
+
+
+class InProcessWorkQueue(WorkQueue):
+    """
+    Thread-safe queue held in memory, for local runs. Received units are not redelivered.
+    """
+
+    def __init__(self):
+        self.units = queue.Queue()
+
+    def send(self, units):
+        for unit in units:
+            self.units.put(json.loads(json.dumps(unit)))  # Units are copied, as they would be through SQS
+
+    def receive(self, max_units=1):
+        received = []
+        while len(received) < max_units:
+            try:
+                received.append((None, self.units.get_nowait()))
+            except queue.Empty:
+                break
+        return received
+
+    def delete(self, receipt):
+        pass
+
+    def release(self, receipt, unit):
+        self.units.put(unit)
+
+
+class SqsWorkQueue(WorkQueue):
+    """
+    Distributes work units through an SQS queue, one message per unit.
+    """
+
+    def __init__(self, queue_url=WORK_QUEUE_URL, sqs_client=None):
+        self.queue_url = queue_url
+        self.sqs_client = sqs_client or get_client('sqs')
+
+    def send(self, units):
+        for start in range(0, len(units), SQS_BATCH_SIZE):
+            entries = [{'Id': str(index), 'MessageBody': json.dumps(unit)}
+                       for index, unit in enumerate(units[start:start + SQS_BATCH_SIZE])]
+            response = self.sqs_client.send_message_batch(QueueUrl=self.queue_url, Entries=entries)
+            if response.get('Failed'):
+                raise RuntimeError(f"Failed to queue {len(response['Failed'])} work units: {response['Failed']}")
+
+    def receive(self, max_units=1):
+        response = self.sqs_client.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_units, SQS_BATCH_SIZE),
+            WaitTimeSeconds=1
+        )
+        return [(message['ReceiptHandle'], json.loads(message['Body'])) for message in response.get('Messages', [])]
+
+    def delete(self, receipt):
+        self.sqs_client.delete_message(QueueUrl=self.queue_url, ReceiptHandle=receipt)
+
+    def release(self, receipt, unit):
+        # Visible again straight away, the receive count still grows so the redrive policy applies
+        self.sqs_client.change_message_visibility(QueueUrl=self.queue_url, ReceiptHandle=receipt, VisibilityTimeout=0)
+
+
+class ResultStore:
+    """
+    Interface for the storage of sharded runs: the run's manifest, one partial
+    result per work unit, a claim held by the reducer while it works, and the
+    reduce outcome once the reports are sent.
+    """
+
+    def save_manifest(self, run_id, manifest):
+        raise NotImplementedError
+
+    def load_manifest(self, run_id):
+        """
+        Returns the manifest saved by the coordinator, None when the run is unknown.
+        """
+        raise NotImplementedError
+
+    def save_partial(self, run_id, unit_id, result):
+        """
+        Saves a unit's result, replacing any earlier one, so redelivered units are harmless.
+        """
+        raise NotImplementedError
+
+    def load_partials(self, run_id):
+        """
+        Returns the saved results of a run as a dict of unit ID to result.
+        """
+        raise NotImplementedError
+
+    def count_partials(self, run_id):
+        """
+        Returns how many units of a run have saved a result.
+        """
+        return len(self.load_partials(run_id))
+
+    def claim_reduce(self, run_id, lease_seconds, force=False):
+        """
+        Returns True when the caller may reduce the run: nobody holds the claim,
+        the last claim is older than lease_seconds (its reducer died), or force is set.
+        """
+        raise NotImplementedError
+
+    def complete_reduce(self, run_id, outcome):
+        """
+        Saves the outcome of a reduce once its reports are sent.
+        """
+        raise NotImplementedError
+
+    def load_reduced(self, run_id):
+        """
+        Returns the saved reduce outcome, None while the run is not reduced.
+        """
+        raise NotImplementedError
+
+
+class InMemoryResultStore(ResultStore):
+    """
+    Keeps sharded runs in memory, for local runs.
+    """
+
+    def __init__(self):
+        self.manifests = {}
+        self.partials = {}
+        self.claims = {}  # Run ID -> time.time() of the reducer's claim
+        self.reduced = {}
+        self.lock = threading.Lock()
+
+    def save_manifest(self, run_id, manifest):
+        with self.lock:
+            self.manifests[run_id] = json.loads(json.dumps(manifest))
+
+    def load_manifest(self, run_id):
+        with self.lock:
+            return self.manifests.get(run_id)
+
+    def save_partial(self, run_id, unit_id, result):
+        # Round-tripped through JSON, so local runs catch results S3 could not store
+        result = json.loads(json.dumps(result, default=str))
+        with self.lock:
+            self.partials.setdefault(run_id, {})[unit_id] = result
+
+    def load_partials(self, run_id):
+        with self.lock:
+            return dict(self.partials.get(run_id, {}))
+
+    def claim_reduce(self, run_id, lease_seconds, force=False):
+        with self.lock:
+            claimed_at = self.claims.get(run_id)
+            if claimed_at is not None and time.time() - claimed_at < lease_seconds and not force:
+                return False
+            self.claims[run_id] = time.time()
+            return True
+
+    def complete_reduce(self, run_id, outcome):
+        with self.lock:
+            self.reduced[run_id] = json.loads(json.dumps(outcome, default=str))
+
+    def load_reduced(self, run_id):
+        with self.lock:
+            return self.reduced.get(run_id)
+
+
+class S3ResultStore(ResultStore):
+    """
+    Stores sharded runs in S3 under <prefix><run ID>/.
+    """
+
+    def __init__(self, bucket=SHARD_RESULTS_BUCKET, prefix=SHARD_RESULTS_PREFIX, s3_client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.s3_client = s3_client or get_client('s3')
+
+    def _key(self, run_id, name):
+        return f"{self.prefix}{run_id}/{name}"
+
+    def _put(self, key, document, **kwargs):
+        self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=json.dumps(document, default=str).encode("utf-8"),
+                                  **kwargs)
+
+    def _get(self, key):
+        document, _ = self._get_with_etag(key)
+        return document
+
+    def _get_with_etag(self, key):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                return None, None
+            raise
+        return json.loads(response['Body'].read()), response['ETag']
+
+    def _put_if(self, key, document, **conditions):
+        # Conditional write, returns False when another writer got there first
+        try:
+            self._put(key, document, **conditions)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in CONDITIONAL_WRITE_CONFLICTS:
+                return False
+            raise
+        return True
+
+    def _partial_keys(self, run_id):
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(run_id, 'partials/')):
+            for entry in page.get('Contents', []):
+                yield entry['Key']
+
+    def save_manifest(self, run_id, manifest):
+        self._put(self._key(run_id, 'manifest.json'), manifest)
+
+    def load_manifest(self, run_id):
+        return self._get(self._key(run_id, 'manifest.json'))
+
+    def save_partial(self, run_id, unit_id, result):
+        self._put(self._key(run_id, f"partials/{unit_id}.json"), result)
+
+    def load_partials(self, run_id):
+        partials = {}
+        for key in self._partial_keys(run_id):
+            unit_id = key[len(self._key(run_id, 'partials/')):-len('.json')]
+            partials[unit_id] = self._get(key)
+        return partials
+
+    def count_partials(self, run_id):
+        return sum(1 for _ in self._partial_keys(run_id))
+
+    def claim_reduce(self, run_id, lease_seconds, force=False):
+        key = self._key(run_id, 'reducing.json')
+        claim = {'run_id': run_id, 'claimed_at': time.time()}
+        if force:
+            self._put(key, claim)
+            return True
+        # Only one of the workers finishing the run at the same time can create the claim
+        if self._put_if(key, claim, IfNoneMatch='*'):
+            return True
+        previous, etag = self._get_with_etag(key)
+        if previous is None or time.time() - previous['claimed_at'] < lease_seconds:
+            return False
+        # The previous reducer died, take over its claim unless someone else already did
+        return self._put_if(key, claim, IfMatch=etag)
+
+    def complete_reduce(self, run_id, outcome):
+        self._put(self._key(run_id, 'reduced.json'), outcome)
+
+    def load_reduced(self, run_id):
+        return self._get(self._key(run_id, 'reduced.json'))
+
+
+_local_queue = InProcessWorkQueue()
+_local_store = InMemoryResultStore()
+
+
+def get_work_queue():
+    """
+    Returns the SQS queue when WORK_QUEUE_URL is set, the in-process queue otherwise.
+    """
+    if WORK_QUEUE_URL:
+        return SqsWorkQueue()
+    return _local_queue
+
+
+def get_result_store():
+    """
+    Returns the S3 store when SHARD_RESULTS_BUCKET is set, the in-memory store otherwise.
+    """
+    if SHARD_RESULTS_BUCKET:
+        return S3ResultStore()
+    return _local_store
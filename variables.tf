@@ -13,4 +13,16 @@ variable "region" {
   type        = string
   description = "AWS region where the resources will be deployed"
   default     = "eu-west-1"
-}
\ No newline at end of file
+}
+
+variable "report_bucket" {
+  type        = string
+  default     = ""
+  description = "Optional S3 bucket for reports too large to email and for the findings state of delta audits"
+}
+
+variable "sharding_enabled" {
+  type        = bool
+  default     = false
+  description = "Create the SQS queue for sharded audits, partial results are stored in report_bucket"
+}